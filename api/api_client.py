@@ -1,5 +1,6 @@
 import requests
 import logging
+from api import http_client
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
@@ -8,7 +9,7 @@ logging.basicConfig(
 
 def fetch_block(api_url):
     try:
-        response = requests.get(api_url)
+        response = http_client.get(api_url)
         response.raise_for_status()
         data = response.json()
         return data
@@ -25,7 +26,7 @@ def fetch_block(api_url):
 
 def test_api_connection(url):
     try:
-        response = requests.get(url, timeout=15)
+        response = http_client.get(url, timeout=15)
         response.raise_for_status()
         logging.info(f"Successfully connected to API at {url}")
         return True
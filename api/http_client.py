@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import utils.config as config
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+
+def create_session(retry):
+    """
+    Creates a session whose connections to each host are kept alive and
+    reused, so repeated node API calls skip the TCP and TLS handshakes.
+    """
+    adapter = HTTPAdapter(
+        pool_connections=config.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=config.HTTP_POOL_SIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Reads are retried on connection errors, timeouts and gateway errors with
+# jittered exponential backoff.
+session = create_session(
+    Retry(
+        total=config.HTTP_RETRIES,
+        backoff_factor=config.HTTP_BACKOFF_FACTOR,
+        backoff_jitter=config.HTTP_BACKOFF_JITTER,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=("GET",),
+        raise_on_status=False,
+    )
+)
+
+# A pushed transaction is only retried when the connection could not be
+# opened, i.e. when the node never saw the request.
+push_session = create_session(
+    Retry(
+        total=config.HTTP_RETRIES,
+        connect=config.HTTP_RETRIES,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=config.HTTP_BACKOFF_FACTOR,
+        backoff_jitter=config.HTTP_BACKOFF_JITTER,
+        allowed_methods=None,
+        raise_on_status=False,
+    )
+)
+
+
+class CircuitBreaker:
+    """
+    Stops calling the node for cooldown seconds once threshold calls in a row
+    have failed. After the cooldown a single trial call is let through: it
+    closes the circuit when it succeeds and opens it again when it fails.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+
+    def is_open(self):
+        with self.lock:
+            return (
+                self.opened_at is not None
+                and time.monotonic() - self.opened_at < self.cooldown
+            )
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.cooldown:
+                return False
+            # Half-open: the next calls wait for the outcome of this one.
+            self.opened_at = now
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logging.warning(
+                        f"Node failed {self.failures} times in a row, "
+                        f"pausing calls for {self.cooldown} seconds."
+                    )
+                self.opened_at = time.monotonic()
+
+
+def get(url, params=None, timeout=None):
+    return session.get(url, params=params, timeout=timeout or config.HTTP_TIMEOUT)
+
+
+def push(url, json=None, timeout=None):
+    # The payload goes in the request body, so its size is not bound by the
+    # URI length limits of the node and the proxies in front of it.
+    return push_session.post(url, json=json, timeout=timeout or config.HTTP_TIMEOUT)
+
+
+async def get_async(url, params=None, timeout=None):
+    return await asyncio.to_thread(get, url, params, timeout)
+
+
+async def push_async(url, json=None, timeout=None):
+    return await asyncio.to_thread(push, url, json, timeout)
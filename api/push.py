@@ -1,10 +1,19 @@
 import logging
 import requests
+import utils.config as config
+from api import http_client
 from upow_transactions.helpers import sha256
+from utils.errors import NodeUnavailableError, TransactionRejectedError
 from utils.utils import Utils
 
 wallet_utils: Utils = Utils()
 
+# Shared by every push, so an unreachable node is not hammered by each
+# payout of a batch in turn.
+node_breaker = http_client.CircuitBreaker(
+    config.NODE_BREAKER_THRESHOLD, config.NODE_BREAKER_COOLDOWN
+)
+
 
 def string_to_bytes(string: str) -> bytes:
     if string is None:
@@ -16,22 +25,36 @@ def string_to_bytes(string: str) -> bytes:
 
 
 async def push_tx(tx, wallet_utils: Utils):
+    """
+    Pushes tx to the node and returns its hash. Raises NodeUnavailableError
+    when the node cannot be reached or fails, and TransactionRejectedError
+    when it refuses the transaction.
+    """
+    if not node_breaker.allow():
+        raise NodeUnavailableError("Node circuit is open, transaction not pushed")
     try:
-        r = requests.get(
-            f"{wallet_utils.NODE_URL}/push_tx", {"tx_hex": tx.hex()}, timeout=10
+        r = await http_client.push_async(
+            f"{wallet_utils.NODE_URL}/push_tx", {"tx_hex": tx.hex()}
         )
-        r.raise_for_status()
-        res = r.json()
-        if res["ok"]:
-            transaction_hash = sha256(tx.hex())
-            logging.info(f"Transaction pushed. Transaction hash: {transaction_hash}")
-            return None, transaction_hash
-        else:
-            logging.error("\nTransaction has not been pushed")
-            return "Transaction not pushed", None
-    except Exception as e:
+        res = r.json() if r.status_code < 500 else None
+    except (requests.RequestException, ValueError) as e:
         logging.error(f"Error during request to node: {e}")
-        return str(e), None
+        node_breaker.record_failure()
+        raise NodeUnavailableError(str(e)) from e
+    if res is None:
+        logging.error(f"Node answered {r.status_code}")
+        node_breaker.record_failure()
+        raise NodeUnavailableError(f"Node answered {r.status_code}")
+
+    node_breaker.record_success()
+    if r.status_code >= 400 or not res.get("ok"):
+        logging.error("\nTransaction has not been pushed")
+        raise TransactionRejectedError(
+            res.get("error") or f"Transaction not pushed ({r.status_code})"
+        )
+    transaction_hash = sha256(tx.hex())
+    logging.info(f"Transaction pushed. Transaction hash: {transaction_hash}")
+    return transaction_hash
 
 
 async def send_transaction(private_key_hex, recipients, amounts, message=None):
@@ -53,8 +76,4 @@ async def send_transaction(private_key_hex, recipients, amounts, message=None):
         tx = await wallet_utils.create_transaction(
             private_key, receiver, amount, message_bytes
         )
-    error_message, transaction_hash = await push_tx(tx, wallet_utils)
-    if transaction_hash:
-        return transaction_hash
-    else:
-        raise Exception(error_message)
+    return await push_tx(tx, wallet_utils)
@@ -33,6 +33,10 @@ def load_model_from_pth(model_path):
         return None  # Return None if loading fails
 
 
+def verify_model_file(model_path):
+    return load_model_from_pth(model_path) is not None
+
+
 def get_pth_files(job, jobname):
     try:
         job_folder_path = os.path.join(job, jobname)
@@ -147,38 +151,173 @@ def create_model_record(model_name, percentage, validators):
         return f"An unexpected error occurred: {e}"
 
 
-def model_exe(job, job_folder_path):
+class FedAvgAggregator:
+    """
+    Folds gradients into a running weighted sum so that only one model has to
+    be held in memory and the final average is a single division.
+    """
+
+    name = "fedavg"
+
+    def weight(self, sub_job):
+        return 1.0
+
+    def fold(self, accumulator, state_dict, weight):
+        if accumulator is None:
+            accumulator = {"weight": 0.0, "state": {}, "dtypes": {}}
+        total = accumulator["state"]
+        for key, value in state_dict.items():
+            if torch.is_floating_point(value):
+                scaled = value.detach().to(torch.float64) * weight
+                total[key] = total[key] + scaled if key in total else scaled
+                accumulator["dtypes"][key] = value.dtype
+            else:
+                total[key] = value.detach().clone()
+        accumulator["weight"] += weight
+        return accumulator
+
+    def finalize(self, accumulator):
+        weight = accumulator["weight"]
+        state_dict = {}
+        for key, value in accumulator["state"].items():
+            if torch.is_floating_point(value):
+                state_dict[key] = (value / weight).to(accumulator["dtypes"][key])
+            else:
+                state_dict[key] = value
+        return state_dict
+
+
+class WeightedMeanAggregator(FedAvgAggregator):
+    """Weights each gradient by the "weight" field of its sub-job."""
+
+    name = "weighted"
+
+    def weight(self, sub_job):
+        try:
+            weight = float(sub_job.get("weight", 1))
+        except (TypeError, ValueError):
+            return 1.0
+        return weight if weight > 0 else 1.0
+
+
+AGGREGATORS = {
+    FedAvgAggregator.name: FedAvgAggregator(),
+    WeightedMeanAggregator.name: WeightedMeanAggregator(),
+}
+DEFAULT_AGGREGATION = FedAvgAggregator.name
+
+
+def get_aggregator(strategy):
+    aggregator = AGGREGATORS.get(strategy or DEFAULT_AGGREGATION)
+    if aggregator is None:
+        logging.warning(
+            f"Unknown aggregation strategy {strategy}, using {DEFAULT_AGGREGATION}"
+        )
+        aggregator = AGGREGATORS[DEFAULT_AGGREGATION]
+    return aggregator
+
+
+def get_accumulator_path(job, jobname):
+    return os.path.join(job, jobname, "aggregate.acc")
+
+
+def get_streaming_flag_path(job, jobname):
+    return os.path.join(job, jobname, "aggregate.stream")
+
+
+def switch_to_streaming(job, jobname):
+    """
+    Gives up on the job's running accumulator after a gradient could not be
+    folded into it. From then on folds are skipped and model_exe streams over
+    every gradient file, so the gradients folded before are not lost.
+    """
+    with open(get_streaming_flag_path(job, jobname), "w"):
+        pass
+    accumulator_path = get_accumulator_path(job, jobname)
+    if os.path.exists(accumulator_path):
+        os.remove(accumulator_path)
+
+
+def fold_gradient(job, jobname, model_path, strategy=None, weight=1.0):
+    """Adds one gradient to the job's running accumulator on disk."""
+    aggregator = get_aggregator(strategy)
+    accumulator_path = get_accumulator_path(job, jobname)
+    if os.path.exists(get_streaming_flag_path(job, jobname)):
+        # model_exe streams over the files, this one included.
+        return True
     try:
-        pth_files = get_pth_files(job, job_folder_path)
+        state_dict = torch.load(model_path)
+        if not isinstance(state_dict, dict):
+            raise ValueError("file does not contain a state dict")
+
+        accumulator = None
+        if os.path.exists(accumulator_path):
+            accumulator = torch.load(accumulator_path)
+        accumulator = aggregator.fold(accumulator, state_dict, weight)
+
+        temp_path = f"{accumulator_path}.tmp"
+        torch.save(accumulator, temp_path)
+        os.replace(temp_path, accumulator_path)
+        return True
     except Exception as e:
-        logging.error(f"Error in fetching .pth files: {e}")
-        return
+        logging.warning(f"Error folding {model_path} into {jobname}: {e}")
+        switch_to_streaming(job, jobname)
+        return False
 
-    models = []
-    for model_path in pth_files:
-        model = load_model_from_pth(model_path)
-        if model is not None:  # Check if the model is loaded successfully
-            models.append(model)
-        else:
-            logging.warning(
-                f"Skipped loading corrupted or incompatible model from {model_path}"
-            )
 
-    if not models:
+def model_exe(job, job_folder_path, strategy=None, weights=None):
+    """
+    Builds the job's combined model from its accumulator, or else from the
+    gradient files on disk, each weighted by weights[file name] (1.0 when
+    missing).
+    """
+    aggregator = get_aggregator(strategy)
+    weights = weights or {}
+    accumulator_path = get_accumulator_path(job, job_folder_path)
+
+    accumulator = None
+    streaming = os.path.exists(get_streaming_flag_path(job, job_folder_path))
+    if not streaming and os.path.exists(accumulator_path):
+        try:
+            accumulator = torch.load(accumulator_path)
+        except Exception as e:
+            logging.error(f"Error loading accumulator {accumulator_path}: {e}")
+
+    if accumulator is None:
+        # Gradients were not all folded as they arrived (a fold failed, or the
+        # job predates the accumulator), so stream over the files one model
+        # at a time.
+        try:
+            pth_files = get_pth_files(job, job_folder_path)
+        except Exception as e:
+            logging.error(f"Error in fetching .pth files: {e}")
+            return
+
+        for model_path in pth_files:
+            model = load_model_from_pth(model_path)
+            if model is None:
+                logging.warning(
+                    f"Skipped loading corrupted or incompatible model from {model_path}"
+                )
+                continue
+            try:
+                weight = float(weights.get(os.path.basename(model_path), 1.0))
+            except (TypeError, ValueError):
+                weight = 1.0
+            accumulator = aggregator.fold(accumulator, model.state_dict(), weight)
+
+    if accumulator is None or not accumulator["weight"]:
         logging.info("No models loaded.")
         return
 
-    # logging.info(f"Loaded models: {models}")
-
     final_folder = "./Models"
     combined_model = SimpleModel()
 
-    for model in models:
-        try:
-            combined_model.load_state_dict(model.state_dict(), strict=False)
-        except Exception as e:
-            logging.error(f"Error combining model states: {e}")
-            return
+    try:
+        combined_model.load_state_dict(aggregator.finalize(accumulator), strict=False)
+    except Exception as e:
+        logging.error(f"Error combining model states: {e}")
+        return
 
     try:
         os.makedirs(final_folder, exist_ok=True)
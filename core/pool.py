@@ -0,0 +1,64 @@
+import asyncio
+import multiprocessing
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import utils.config as config
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+
+class PoolBusyError(Exception):
+    pass
+
+
+class ModelWorkerPool:
+    """
+    Runs torch work (gradient verification, model aggregation) in worker
+    processes so the websocket event loop is never blocked by it.
+    """
+
+    def __init__(self, max_workers, max_queued):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.pending = 0
+        self.executor = None
+
+    def _get_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self.executor
+
+    async def run(self, func, *args, bounded=True):
+        """
+        Runs func(*args) in a worker process and returns its result.
+
+        Bounded jobs are rejected with PoolBusyError once every worker is busy
+        and max_queued jobs are already waiting.
+        """
+        if bounded and self.pending >= self.max_workers + self.max_queued:
+            raise PoolBusyError("Model worker pool is busy, please retry later.")
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        except BrokenProcessPool:
+            logging.error("Model worker pool crashed, restarting it.")
+            self.executor = None
+            raise
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+model_pool = ModelWorkerPool(config.MODEL_POOL_SIZE, config.MODEL_POOL_MAX_QUEUED)
@@ -13,6 +13,7 @@ logging.basicConfig(
     level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
 )
 from database.mongodb import minerBalanceUpdateData
+from pymongo.errors import DuplicateKeyError
 
 
 def store_in_db(block_height, updates):
@@ -29,18 +30,14 @@ def store_in_db(block_height, updates):
         return
 
     try:
-        existing_document = minerBalanceUpdateData.find_one(
-            {"block_height": block_height}
-        )
-        if existing_document:
-            logging.info(
-                f"Block height {block_height} already exists. Consider updating it instead of inserting a new one."
-            )
-            return
-
+        # The unique block_height index rejects a block range stored twice.
         document = {"block_height": block_height, "updates": updates}
         minerBalanceUpdateData.insert_one(document)
         logging.info(f"Successfully stored updates for block height {block_height}.")
+    except DuplicateKeyError:
+        logging.info(
+            f"Block height {block_height} already exists. Consider updating it instead of inserting a new one."
+        )
     except Exception as e:
         logging.error(
             f"Error storing data in MongoDB for block height {block_height}: {e}"
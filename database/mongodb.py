@@ -1,6 +1,11 @@
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo import MongoClient, IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import ConnectionFailure, OperationFailure
 import utils.config as config
+import logging
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
 
 
 def test_db_connection():
@@ -29,3 +34,120 @@ minerBalanceUpdateData = db.minerBalanceUpdateData
 errorTransaction = db.errorTransaction
 catchTransaction = db.catchTransaction
 pushHistory = db.pushHistory
+payoutDeadLetter = db.payoutDeadLetter
+payoutLedger = db.payoutLedger
+
+
+# Indexes every collection needs, by collection name. They are created at
+# startup by ensure_indexes; an index is identified by its generated name,
+# so changing the keys or options of one means dropping the old one first.
+INDEXES = {
+    # Block transactions are deduplicated by upserting their hash.
+    "minerProcessedTransaction": [IndexModel([("hash", ASCENDING)], unique=True)],
+    "minerBalanceUpdateData": [
+        IndexModel([("block_height", ASCENDING)], unique=True)
+    ],
+    # Withdrawal queue: claimed by status and due time, oldest first.
+    "minerTransactionsCollection": [
+        IndexModel(
+            [
+                ("status", ASCENDING),
+                ("next_attempt_at", ASCENDING),
+                ("timestamp", ASCENDING),
+            ]
+        ),
+        IndexModel([("id", ASCENDING)]),
+        IndexModel([("claim_token", ASCENDING)], sparse=True),
+        IndexModel([("wallet_address", ASCENDING)]),
+    ],
+    "payoutLedger": [
+        # Backs the newest-first pages of /latestwithdraws/.
+        IndexModel(
+            [
+                ("wallet_address", ASCENDING),
+                ("event", ASCENDING),
+                ("timestamp", DESCENDING),
+                ("_id", DESCENDING),
+            ]
+        ),
+        IndexModel([("payout_id", ASCENDING)]),
+        # Makes the migration of the minerTransactionsPushed history rerunnable.
+        IndexModel([("legacy_key", ASCENDING)], unique=True, sparse=True),
+        # Error events expire, attempts and pushes are kept.
+        IndexModel(
+            [("timestamp", ASCENDING)],
+            expireAfterSeconds=config.PAYOUT_ERROR_TTL,
+            partialFilterExpression={"event": "error"},
+        ),
+    ],
+    # Dead-lettered withdrawals were already taken from the miners'
+    # balances, so they are kept until settled and never expire.
+    "payoutDeadLetter": [
+        IndexModel([("wallet_address", ASCENDING)]),
+        IndexModel([("dead_lettered_at", ASCENDING)]),
+    ],
+}
+
+
+def index_name(model):
+    return model.document["name"]
+
+
+def ensure_indexes():
+    """
+    Creates the missing indexes of INDEXES. Creating an index that already
+    exists is a no-op. An index that cannot be built (e.g. a unique index
+    over duplicated documents) is logged and skipped so the pool still
+    starts. An existing index whose TTL differs from its declaration is
+    dropped and rebuilt. Returns the names of the indexes that failed.
+    """
+    failed = []
+    for collection_name, models in INDEXES.items():
+        existing = db[collection_name].index_information()
+        for model in models:
+            try:
+                current = existing.get(index_name(model))
+                if current is not None and current.get(
+                    "expireAfterSeconds"
+                ) != model.document.get("expireAfterSeconds"):
+                    db[collection_name].drop_index(index_name(model))
+                db[collection_name].create_indexes([model])
+            except OperationFailure as e:
+                name = f"{collection_name}.{index_name(model)}"
+                logging.error(f"Could not create index {name}: {e}")
+                failed.append(name)
+    return failed
+
+
+def report_indexes():
+    """
+    Logs the declared indexes missing from MongoDB, and the indexes that
+    have not been used since mongod started according to $indexStats.
+    Returns both as lists of "collection.index" names.
+    """
+    missing = []
+    unused = []
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        existing = collection.index_information()
+        missing.extend(
+            f"{collection_name}.{index_name(model)}"
+            for model in models
+            if index_name(model) not in existing
+        )
+        try:
+            stats = list(collection.aggregate([{"$indexStats": {}}]))
+        except OperationFailure as e:
+            logging.warning(f"Could not read index stats of {collection_name}: {e}")
+            continue
+        unused.extend(
+            f"{collection_name}.{stat['name']}"
+            for stat in stats
+            if stat["name"] != "_id_" and stat["accesses"]["ops"] == 0
+        )
+
+    if missing:
+        logging.warning(f"Missing indexes: {', '.join(missing)}")
+    if unused:
+        logging.info(f"Indexes unused since mongod started: {', '.join(unused)}")
+    return missing, unused
@@ -6,11 +6,13 @@ logging.basicConfig(
 )
 
 
-def set_last_block_height(block_height):
+def set_last_block_height(block_height, client=None):
+    # client can be a pipeline, to checkpoint the height in the same
+    # transaction as the rewards of the blocks up to it.
     try:
         # Ensure block_height is an integer to prevent data type issues
         block_height = int(block_height)
-        r.set("last_block_height", block_height)
+        (client or r).set("last_block_height", block_height)
         return True
     except ValueError:
         logging.error("Invalid block_height type. Expected an integer.")
@@ -1,6 +1,8 @@
 import redis
 import json
+import datetime
 from database.database import r
+import utils.config as config
 
 import logging
 
@@ -9,14 +11,117 @@ logging.basicConfig(
 )
 
 
-def create_job(job_id, file_hashes):
+def aggregation_key(job_id):
+    return f"{job_id}:aggregation"
+
+
+def pending_key(job_id):
+    return f"{job_id}:pending"
+
+
+def completed_key(job_id):
+    return f"{job_id}:completed"
+
+
+def assignable_key(job_id):
+    return f"{job_id}:assignable"
+
+
+# Jobs whose gradients are all in, waiting for their combined model.
+FINALIZE_JOBS = "jobs:finalize"
+
+
+def weights_key(job_id):
+    """Hash of the aggregation weight of every accepted gradient file."""
+    return f"{job_id}:weights"
+
+
+def leases_key(job_id):
+    return f"{job_id}:leases"
+
+
+def lease_seconds_key(job_id):
+    return f"{job_id}:lease_seconds"
+
+
+def get_lease_seconds(job_id):
+    lease_seconds = r.get(lease_seconds_key(job_id))
+    try:
+        return int(lease_seconds) if lease_seconds else config.SUBJOB_LEASE_SECONDS
+    except ValueError:
+        return config.SUBJOB_LEASE_SECONDS
+
+
+def init_job_tracking(pipe, job_id, pending_hashes, lease_expiries=None):
+    """
+    Queues the tracking structures of a job on pipe: the pending set, the
+    completion counter, the assignable sorted set of free sub-jobs and the
+    leases sorted set scoring every leased sub-job by its expiry epoch.
+    """
+    lease_expiries = lease_expiries or {}
+    pipe.delete(pending_key(job_id), assignable_key(job_id), leases_key(job_id))
+    if pending_hashes:
+        pipe.sadd(pending_key(job_id), *pending_hashes)
+        free_hashes = [h for h in pending_hashes if h not in lease_expiries]
+        if free_hashes:
+            pipe.zadd(assignable_key(job_id), {h: 0 for h in free_hashes})
+        if lease_expiries:
+            pipe.zadd(leases_key(job_id), lease_expiries)
+    pipe.set(completed_key(job_id), 0)
+
+
+def ensure_job_tracking(job_id):
+    """Builds the tracking structures for jobs created before they existed."""
+    if r.exists(completed_key(job_id)):
+        return
+
+    lease_seconds = get_lease_seconds(job_id)
+    pending_hashes = []
+    lease_expiries = {}
+    for file_hash, json_data in r.hgetall(job_id).items():
+        try:
+            data = json.loads(json_data)
+        except json.JSONDecodeError:
+            logging.error(f"Error decoding JSON data for {file_hash} in {job_id}.")
+            continue
+        if "gradient" not in data or int(data["gradient"]) == 0:
+            pending_hashes.append(file_hash)
+            try:
+                last_active = datetime.datetime.fromisoformat(data.get("last_active"))
+            except (TypeError, ValueError):
+                continue
+            lease_expiries[file_hash] = (
+                last_active.replace(tzinfo=datetime.timezone.utc).timestamp()
+                + lease_seconds
+            )
+
+    pipe = r.pipeline()
+    init_job_tracking(pipe, job_id, pending_hashes, lease_expiries)
+    pipe.execute()
+
+
+def create_job(job_id, file_hashes, aggregation=None, lease_seconds=None):
     try:
+        job_data = {}
         for file_hash, data in file_hashes.items():
             try:
-                json_data = json.dumps(data)
-                r.hset(job_id, file_hash, json_data)
+                job_data[file_hash] = json.dumps(data)
             except TypeError as e:
                 logging.error(f"Error serializing data for file_hash {file_hash}: {e}")
+
+        if not job_data:
+            logging.error(f"Job {job_id} has no sub-jobs to create.")
+            return None
+
+        pipe = r.pipeline()
+        pipe.hset(job_id, mapping=job_data)
+        if aggregation:
+            pipe.set(aggregation_key(job_id), aggregation)
+        if lease_seconds:
+            pipe.set(lease_seconds_key(job_id), int(lease_seconds))
+        init_job_tracking(pipe, job_id, list(job_data))
+        pipe.execute()
+
         logging.info(f"Job {job_id} created successfully.")
         return job_id
     except redis.RedisError as e:
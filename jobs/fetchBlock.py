@@ -1,30 +1,35 @@
 from database.database import r
-import json
-from database.leveldatabase import store_in_db, retrieve_from_db
+from database.leveldatabase import store_in_db
 from database.redis_client import set_last_block_height, get_last_block_height
-from database.mongodb import minerProcessedTransaction, minerTransactionsPushed
-from pymongo.errors import PyMongoError
+from database.mongodb import minerProcessedTransaction
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 import utils.config as config
 import logging
 from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from api.api_client import fetch_block
+from mining.updateMiner import MINERS_INDEX, miner_key
+from transactions.payoutLedger import get_pushed_payouts
+from utils.money import to_units, from_units, format_units, percent_of, split_units
 
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
 )
 
+POOL_OWNER_PERCENT = 18
+MIN_DEDUCTION_UNITS = to_units("0.001")
+
 
 def get_balance_from_wallet(wallet_address):
     try:
-        miner_data_json = r.hget("miners_list", wallet_address)
-        if miner_data_json is None:
+        balance_units = r.hget(miner_key(wallet_address), "balance_units")
+        if balance_units is not None:
+            return float(from_units(balance_units))
+        elif not r.exists(miner_key(wallet_address)):
             return "Error: Wallet address not found."
-        miner_data = json.loads(miner_data_json)
-
-        balance = miner_data.get("balance")
-        if balance is not None:
-            return balance
         else:
             return "Error: Balance not found for the given wallet address."
     except Exception as e:
@@ -35,9 +40,11 @@ def get_balance_poolowner():
     try:
         pool_owner_data = r.hgetall("pool_owner")
         if pool_owner_data:
+            if "amount_units" in pool_owner_data:
+                return format_units(pool_owner_data["amount_units"])
             balance = pool_owner_data.get("amount")
             if balance is not None:
-                return balance
+                return format_units(to_units(balance))
             else:
                 return "Error: Balance not found for the pool owner."
         else:
@@ -46,27 +53,96 @@ def get_balance_poolowner():
         return f"Error: get_balance_poolowner An unexpected error occurred - {str(e)}"
 
 
+# Deducts ARGV[1] units from the balance of the miner hash KEYS[1] in one
+# atomic step. ARGV[2] is the smallest balance a miner may withdraw from.
+DEDUCT_MINER_BALANCE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {0, 'Error: Wallet address not found.'}
+end
+local units = tonumber(redis.call('HGET', KEYS[1], 'balance_units'))
+if units == nil or units < tonumber(ARGV[2]) then
+    return {0, 'Error: Insufficient balance for deduction.'}
+end
+if units - tonumber(ARGV[1]) < 0 then
+    return {0, 'Error: Deduction amount exceeds current balance.'}
+end
+local new_units = redis.call('HINCRBY', KEYS[1], 'balance_units', -tonumber(ARGV[1]))
+return {1, new_units}
+"""
+
+# Converts a pool owner hash written before balances were fixed-point from
+# its float 'amount' field to integer 'amount_units'.
+MIGRATE_POOL_OWNER_AMOUNT = """
+if redis.call('HEXISTS', KEYS[1], 'amount_units') == 0 then
+    local legacy = tonumber(redis.call('HGET', KEYS[1], 'amount')) or 0
+    redis.call('HSET', KEYS[1], 'amount_units',
+        string.format('%d', math.floor(legacy * 100000000 + 0.5)))
+end
+redis.call('HDEL', KEYS[1], 'amount')
+"""
+
+# Deducts ARGV[1] units from the pool owner's amount in one atomic step.
+DEDUCT_POOL_OWNER_SCRIPT = (
+    """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {0, 'Error: Pool owner data not found.'}
+end
+local wallet_address = redis.call('HGET', KEYS[1], 'wallet_address')
+if not wallet_address then
+    return {0, 'Error: Wallet address not found.'}
+end
+"""
+    + MIGRATE_POOL_OWNER_AMOUNT
+    + """
+local units = tonumber(redis.call('HGET', KEYS[1], 'amount_units'))
+if units - tonumber(ARGV[1]) < 0 then
+    return {0, 'Error: Deduction amount exceeds current balance.'}
+end
+redis.call('HINCRBY', KEYS[1], 'amount_units', -tonumber(ARGV[1]))
+return {1, wallet_address}
+"""
+)
+
+# Credits ARGV[1] units to the pool owner. ARGV[3] is the wallet address used
+# when the pool owner has none yet.
+CREDIT_POOL_OWNER_SCRIPT = (
+    MIGRATE_POOL_OWNER_AMOUNT
+    + """
+redis.call('HINCRBY', KEYS[1], 'amount_units', ARGV[1])
+redis.call('HSET', KEYS[1], 'last_processed', ARGV[2])
+redis.call('HSETNX', KEYS[1], 'wallet_address', ARGV[3])
+return 1
+"""
+)
+
+deduct_miner_balance = r.register_script(DEDUCT_MINER_BALANCE_SCRIPT)
+deduct_pool_owner_amount = r.register_script(DEDUCT_POOL_OWNER_SCRIPT)
+credit_pool_owner_amount = r.register_script(CREDIT_POOL_OWNER_SCRIPT)
+
+
+def deduction_units(amount_to_deduct):
+    """Returns the deduction in smallest units, or None if it is invalid."""
+    try:
+        units = to_units(amount_to_deduct, exact=True)
+    except (ValueError, ArithmeticError):
+        return None
+    return units if units >= MIN_DEDUCTION_UNITS else None
+
+
 def deduct_balance_from_wallet(wallet_address, amount_to_deduct):
     try:
-        miner_data_json = r.hget("miners_list", wallet_address)
-        if miner_data_json is None:
-            return None, "Error: Wallet address not found."
-        miner_data = json.loads(miner_data_json)
-        balance = miner_data.get("balance", 0)
-        if balance is None or balance < 0.001:
-            return None, "Error: Insufficient balance for deduction."
-
-        if amount_to_deduct < 0.001 or len(str(amount_to_deduct).split(".")[-1]) > 8:
+        units = deduction_units(amount_to_deduct)
+        if units is None:
             return (
                 None,
                 "Error: Invalid deduction amount. Must be at least 0.001 and have no more than 8 decimal places.",
             )
-        new_balance = balance - amount_to_deduct
-        if new_balance < 0:
-            return None, "Error: Deduction amount exceeds current balance."
-        miner_data["balance"] = round(new_balance, 8)
-        r.hset("miners_list", wallet_address, json.dumps(miner_data))
-        return True, round(amount_to_deduct, 8)
+        success, message = deduct_miner_balance(
+            keys=[miner_key(wallet_address)], args=[units, MIN_DEDUCTION_UNITS]
+        )
+        if not success:
+            return None, message
+        return True, float(from_units(units))
     except Exception as e:
 
         return (
@@ -77,31 +153,18 @@ def deduct_balance_from_wallet(wallet_address, amount_to_deduct):
 
 def deduct_balance_from_poolowner(amount_to_deduct):
     try:
-        pool_owner_data = r.hgetall("pool_owner")
-        if not pool_owner_data:
-            return None, "Error: Pool owner data not found.", None
-
-        current_amount = float(pool_owner_data.get("amount", 0.0))
-        wallet_address = pool_owner_data.get("wallet_address", None)
-
-        if wallet_address is None:
-            return None, "Error: Wallet address not found.", None
-
-        if amount_to_deduct < 0.001 or len(str(amount_to_deduct).split(".")[-1]) > 8:
+        units = deduction_units(amount_to_deduct)
+        if units is None:
             return (
                 None,
                 "Error: Invalid deduction amount. Must be at least 0.001 and have no more than 8 decimal places.",
                 None,
             )
+        success, result = deduct_pool_owner_amount(keys=["pool_owner"], args=[units])
+        if not success:
+            return None, result, None
 
-        new_amount = current_amount - amount_to_deduct
-        if new_amount < 0:
-            return None, "Error: Deduction amount exceeds current balance.", None
-
-        pool_owner_data["amount"] = str(round(new_amount, 8))
-        r.hset("pool_owner", mapping=pool_owner_data)
-
-        return True, round(amount_to_deduct, 8), wallet_address
+        return True, float(from_units(units)), result
     except Exception as e:
         return (
             None,
@@ -110,20 +173,30 @@ def deduct_balance_from_poolowner(amount_to_deduct):
         )
 
 
-def get_miner_TransactionsPushed(wallet_address):
+def get_miner_TransactionsPushed(
+    wallet_address, limit=None, cursor=None, fields=None
+):
     try:
-        wallet_details = minerTransactionsPushed.find_one(
-            {"wallet_address": wallet_address}
+        limit = limit or config.LATEST_WITHDRAWS_LIMIT
+        transactions, next_cursor = get_pushed_payouts(
+            wallet_address, limit, cursor, fields
         )
-        if wallet_details:
-            # Convert ObjectId to string
-            wallet_details["_id"] = str(wallet_details["_id"])
-            return {"success": True, "data": wallet_details}
+        if transactions or cursor:
+            return {
+                "success": True,
+                "data": {
+                    "wallet_address": wallet_address,
+                    "transactions": transactions,
+                    "next_cursor": next_cursor,
+                },
+            }
         else:
             return {
                 "success": False,
                 "message": "No details found for the given wallet address.",
             }
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
     except PyMongoError as e:
         return {
             "success": False,
@@ -138,107 +211,217 @@ def get_miner_TransactionsPushed(wallet_address):
         }
 
 
-def calculate_percentages(total_amount):
-    percentages = {"18%": 0, "82%": 0}
-    percentages["18%"] = round(total_amount * 0.18, 8)
-    percentages["82%"] = round(total_amount * 0.82, 8)
-    return percentages
+def calculate_percentages(total_units):
+    """
+    Splits total_units between the pool owner and the miners. The miners get
+    whatever the owner's rounded-down share leaves, so nothing is lost.
+    """
+    owner_units = percent_of(total_units, POOL_OWNER_PERCENT)
+    return {"18%": owner_units, "82%": total_units - owner_units}
+
+
+def queue_pool_owner_credit(pipe, amount_units):
+    credit_pool_owner_amount(
+        keys=["pool_owner"],
+        args=[
+            amount_units,
+            datetime.utcnow().isoformat(),
+            config.MINERPOOL_REWARD_WALLET_ADDRESS,
+        ],
+        client=pipe,
+    )
+
+
+def get_miner_scores():
+    """Returns the positive score of every miner, read with one round trip."""
+    wallets = list(r.smembers(MINERS_INDEX))
+    pipe = r.pipeline(transaction=False)
+    for wallet in wallets:
+        pipe.hget(miner_key(wallet), "score")
+
+    scores = {}
+    for wallet, score in zip(wallets, pipe.execute()):
+        try:
+            score = int(score or 0)
+        except ValueError as e:
+            logging.warning(f"Error processing miner {wallet}: {e}")
+            continue
+        if score > 0:
+            scores[wallet] = score
+    return scores
+
+
+def queue_miner_credits(pipe, amount_units):
+    """
+    Queues the share of every scored miner on pipe. Each miner gets its share
+    and loses the score it was paid for with HINCRBY, so score bumps and
+    withdrawals made while the epoch is computed are kept without any retry.
+    Returns the shares and the scores they were computed from.
+    """
+    scores = get_miner_scores()
+    if not scores:
+        raise ValueError("No scores were computed")
+    shares = split_units(amount_units, scores)
+
+    for wallet, share in shares.items():
+        pipe.hincrby(miner_key(wallet), "balance_units", share)
+        pipe.hincrby(miner_key(wallet), "score", -scores[wallet])
+    return shares, scores
+
+
+def commit_rewards(percentages, block_range, last_block_id, new_hashes):
+    """
+    Credits the miners and the pool owner for a batch of blocks and moves the
+    last processed height past it in one MULTI/EXEC, so a batch is either
+    fully applied or retried as a whole. The rewarded transactions are only
+    recorded as processed once that succeeded. When no miner has a score, no
+    miner did any work for these blocks, so their share goes to the pool
+    owner instead of waiting for miners who join later.
+    """
+    shares, scores = {}, {}
+    owner_units = percentages["18%"]
+    pipe = r.pipeline()
+    if percentages["82%"] > 0:
+        try:
+            shares, scores = queue_miner_credits(pipe, percentages["82%"])
+        except ValueError as e:
+            logging.warning(
+                f"Miner share of blocks {block_range} credited to the pool owner: {e}"
+            )
+            owner_units += percentages["82%"]
+    if owner_units > 0:
+        queue_pool_owner_credit(pipe, owner_units)
+    set_last_block_height(last_block_id, client=pipe)
+    results = pipe.execute()
+    # A crash right here leaves the hashes unrecorded, but the height has
+    # moved past their blocks so they are not fetched again.
+    record_transactions(new_hashes)
+
+    if not shares:
+        return
+
+    miner_updates = {}
+    balances = results[: 2 * len(shares) : 2]
+    for (wallet, share), current_units in zip(shares.items(), balances):
+        miner_updates[wallet] = {
+            "previous_balance": format_units(current_units - share),
+            "score": scores[wallet],
+            "added_amount": format_units(share),
+            "current_balance": format_units(current_units),
+        }
+    store_in_db(block_range, miner_updates)
+
+    logging.info("Balances updated and scores reset.")
 
 
-def update_pool_owner(amount):
+def get_chain_tip():
+    data = fetch_block(f"{config.API_URL}/get_mining_info")
     try:
-        pool_owner_data = r.hgetall("pool_owner")
+        return int(data["result"]["last_block"]["id"])
+    except (TypeError, KeyError, ValueError):
+        logging.warning("Could not read the chain tip from get_mining_info.")
+        return None
 
-        if pool_owner_data:
-            current_amount = float(pool_owner_data.get("amount", 0.0))
-            wallet_address = pool_owner_data.get("wallet_address", None)
-        else:
-            current_amount = 0.0
-            wallet_address = config.MINERPOOL_REWARD_WALLET_ADDRESS
-
-        new_amount = round(current_amount + amount, 8)
-        current_time_utc = datetime.utcnow().isoformat()
-
-        r.hset(
-            "pool_owner",
-            mapping={
-                "amount": str(new_amount),
-                "last_processed": current_time_utc,
-                "wallet_address": wallet_address,
-            },
+
+def fetch_blocks(start_height, end_height):
+    """
+    Fetches the blocks from start_height to end_height in pages of
+    CATCHUP_PAGE_SIZE, CATCHUP_CONCURRENCY pages at a time. Blocks after the
+    first missing or short page are dropped so the result stays contiguous.
+    """
+    offsets = range(start_height, end_height + 1, config.CATCHUP_PAGE_SIZE)
+
+    def fetch_page(offset):
+        limit = min(config.CATCHUP_PAGE_SIZE, end_height - offset + 1)
+        return limit, fetch_block(
+            f"{config.API_URL}/get_blocks_details?offset={offset}&limit={limit}"
         )
 
-    except Exception as e:
-        logging.error(f"update_pool_owner An unexpected error occurred: {e}")
+    with ThreadPoolExecutor(max_workers=config.CATCHUP_CONCURRENCY) as executor:
+        pages = list(executor.map(fetch_page, offsets))
 
+    blocks = []
+    for limit, page in pages:
+        if page is None or not page.get("result"):
+            break
+        blocks.extend(page["result"])
+        if len(page["result"]) < limit:
+            break
+    return blocks
 
-def update_miner_balances(amount, block_range):
-    miner_updates = {}
-    try:
-        miners_data = r.hgetall("miners_list")
-
-        filtered_miners = {}
-        total_score = 0
-
-        for miner, data in miners_data.items():
-            try:
-                miner_data = json.loads(data)
-                score = int(miner_data["score"])
-                if score > 0:
-                    filtered_miners[miner] = miner_data
-                    total_score += score
-            except (ValueError, json.JSONDecodeError) as e:
-                logging.warning(f"Error processing miner {miner}: {e}")
-
-        if total_score == 0:
-            raise ValueError("No scores were computed")
-
-        for miner, data in filtered_miners.items():
-            try:
-                previous_balance = data["balance"]
-                score = int(data["score"])
-                miner_share = (score / total_score) * amount
-                miner_share = round(miner_share, 8)
-                data["balance"] = round(data["balance"] + miner_share, 8)
-                data["score"] = "0"
-                r.hset("miners_list", miner, json.dumps(data))
-                miner_updates[miner] = {
-                    "previous_balance": previous_balance,
-                    "score": score,
-                    "added_amount": miner_share,
-                    "current_balance": data["balance"],
-                }
-            except Exception as e:
-                logging.error(f"Error updating miner {miner}: {e}")
-
-        store_in_db(block_range, miner_updates)
-
-        retrieve_from_db(block_range)
-
-        logging.info("Balances updated and scores reset.")
 
-    except Exception as e:
-        logging.error(f"update_miner_balances An unexpected error occurred: {e}")
+class RecentTransactions:
+    """LRU of transaction hashes already recorded in minerProcessedTransaction."""
 
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hashes = OrderedDict()
 
-def insert_unique_transaction(hash_value):
-    try:
-        result = minerProcessedTransaction.update_one(
-            {"hash": hash_value},
-            {"$setOnInsert": {"hash": hash_value}},
-            upsert=True,
-        )
-        if result.upserted_id is not None:
-            # logging.info(f"Inserted new transaction with hash: {hash_value}")
-            return True
-        else:
-            logging.info(f"Transaction with hash: {hash_value} already exists.")
+    def __contains__(self, hash_value):
+        if hash_value not in self.hashes:
             return False
-    except PyMongoError as e:
-        logging.error(
-            f"Failed to insert or check transaction with hash: {hash_value}. Error: {e}"
+        self.hashes.move_to_end(hash_value)
+        return True
+
+    def add(self, hash_value):
+        self.hashes[hash_value] = None
+        self.hashes.move_to_end(hash_value)
+        if len(self.hashes) > self.maxsize:
+            self.hashes.popitem(last=False)
+
+
+recent_transactions = RecentTransactions(config.RECENT_TRANSACTIONS_SIZE)
+
+
+def find_new_transactions(hash_values):
+    """
+    Returns the hashes of hash_values that were never processed. Hashes seen
+    recently are skipped locally, the rest are looked up with one query.
+    Nothing is recorded: see record_transactions.
+    """
+    candidates = [
+        h for h in dict.fromkeys(hash_values) if h not in recent_transactions
+    ]
+    if not candidates:
+        return set()
+
+    processed = {
+        document["hash"]
+        for document in minerProcessedTransaction.find(
+            {"hash": {"$in": candidates}}, {"_id": 0, "hash": 1}
         )
-        return None
+    }
+    for h in processed:
+        recent_transactions.add(h)
+    return set(candidates) - processed
+
+
+def record_transactions(hash_values):
+    """
+    Records hash_values as processed with a single unordered bulk_write of
+    upserts. Called once their rewards are committed.
+    """
+    if not hash_values:
+        return
+
+    operations = [
+        UpdateOne({"hash": h}, {"$setOnInsert": {"hash": h}}, upsert=True)
+        for h in hash_values
+    ]
+    try:
+        minerProcessedTransaction.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Upserts that raced with another writer fail with a duplicate key
+        # error, which means the hash is already recorded.
+        failed = [
+            error for error in e.details["writeErrors"] if error["code"] != 11000
+        ]
+        if failed:
+            logging.error(f"Failed to record transactions: {failed}")
+            raise
+
+    for h in hash_values:
+        recent_transactions.add(h)
 
 
 def process_all():
@@ -247,32 +430,41 @@ def process_all():
 
         if last_block_height is None:
             logging.info("No last block height found in Redis, using hardcoded value.")
-            last_block_height = config.TRACK
+            last_block_height = int(config.TRACK)
         else:
             last_block_height += 1
 
         logging.info(f"Starting processing from block height: {last_block_height}")
 
-        data = fetch_block(
-            f"{config.API_URL}/get_blocks_details?offset={last_block_height}&limit=10"
-        )
+        # Far behind the tip (e.g. after downtime) the pool catches up in large
+        # concurrent batches, otherwise it follows the tip page by page.
+        tip = get_chain_tip()
+        if tip is not None and tip - last_block_height >= config.BLOCK_PAGE_SIZE:
+            end_height = min(tip, last_block_height + config.CATCHUP_MAX_BLOCKS - 1)
+            logging.info(f"Catching up on blocks {last_block_height}-{end_height}.")
+            blocks = fetch_blocks(last_block_height, end_height)
+        else:
+            data = fetch_block(
+                f"{config.API_URL}/get_blocks_details?offset={last_block_height}&limit={config.BLOCK_PAGE_SIZE}"
+            )
+            blocks = data["result"] if data is not None else None
 
-        if data is None or not data["result"]:
+        if not blocks:
             logging.error("No block data retrieved or no new blocks since last check.")
             return None
 
-        total_amount = 0
-        first_block_id = data["result"][0]["block"]["id"]
-        last_block_idX = data["result"][-1]["block"]["id"]
+        candidates = {}
+        first_block_id = blocks[0]["block"]["id"]
+        last_block_idX = blocks[-1]["block"]["id"]
         last_block_id = None
 
-        for block in data["result"]:
+        for block in blocks:
             block_id = block["block"]["id"]
             last_block_id = block_id
 
             for transaction in block["transactions"]:
                 hash_value = transaction["hash"]
-                transaction_amount = 0  # Initialize transaction amount
+                transaction_amount = 0  # Initialize transaction amount (units)
 
                 if transaction.get("transaction_type", "REGULAR") != "REGULAR":
                     continue
@@ -290,35 +482,32 @@ def process_all():
                         and output["type"] == "REGULAR"
                         and output["address"] not in input_addresses
                     ):
-                        transaction_amount += output["amount"]
+                        transaction_amount += to_units(output["amount"])
 
-                # Only proceed if the transaction is relevant and not already processed
                 if transaction_amount > 0:
-                    if insert_unique_transaction(hash_value):
-                        # Add the transaction amount only if it's a new transaction
-                        total_amount += transaction_amount
-                    else:
-                        logging.info(
-                            f"Skipping already processed transaction: {hash_value}"
-                        )
-
-        if last_block_id is not None:
-            set_last_block_height(last_block_id)
-        else:
-            logging.info("No new blocks to process.")
+                    candidates[hash_value] = (
+                        candidates.get(hash_value, 0) + transaction_amount
+                    )
+
+        # Only the transactions that were not processed before are rewarded
+        new_hashes = find_new_transactions(list(candidates))
+        total_amount = 0
+        for hash_value, transaction_amount in candidates.items():
+            if hash_value in new_hashes:
+                total_amount += transaction_amount
+            else:
+                logging.info(f"Skipping already processed transaction: {hash_value}")
 
         if total_amount <= 0:
             logging.info(
                 f"No relevant transactions found for {config.MINERPOOL_WALLET_ADDRESS} in the latest blocks."
             )
-            return None
 
         percentages = calculate_percentages(total_amount)
         block_range_str = f"{first_block_id}-{last_block_idX}"
 
-        # print("percentages", percentages, "total_amount", total_amount)
-
-        return percentages, block_range_str
+        caught_up = tip is None or last_block_id >= tip
+        return percentages, block_range_str, last_block_id, new_hashes, caught_up
 
     except Exception as e:
         logging.error(f"An error occurred during process_all: {e}")
@@ -326,15 +515,20 @@ def process_all():
 
 
 def process_transactions():
+    """
+    Processes the next batch of blocks. Returns False while the pool is still
+    behind the chain tip, so the caller can fetch the next batch right away.
+    """
     try:
         info = process_all()
         if info is not None:
-            percentages, block_range_str = info
-            update_miner_balances(percentages["82%"], block_range_str)
-            update_pool_owner(percentages["18%"])
+            percentages, block_range_str, last_block_id, new_hashes, caught_up = info
+            commit_rewards(percentages, block_range_str, last_block_id, new_hashes)
+            return caught_up
         else:
             logging.error("Skipping process_all due to processing error or no data.")
     except ValueError as e:
         logging.error(f"Error fetching block data: {e}")
     except Exception as e:
         logging.error(f"process_transactions An unexpected error occurred: {e}")
+    return True
@@ -97,7 +97,12 @@ def request_job(wallet_id, message_type):
 
         if file_hashes:
             job_id = response_data.get("jobname")
-            value = create_job(job_id, file_hashes)
+            value = create_job(
+                job_id,
+                file_hashes,
+                response_data.get("aggregation"),
+                response_data.get("lease_seconds"),
+            )
             if value:
                 result = active_mining(value)
                 status = mining_status(True)
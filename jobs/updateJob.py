@@ -1,11 +1,19 @@
 import redis
 import json
 import datetime
+import time
 import utils.config as config
 import logging
 from database.database import r
 from mining.activeMinig import mining_status
 from jobs.requestJob import request_job
+from jobs.createJob import (
+    assignable_key,
+    leases_key,
+    pending_key,
+    get_lease_seconds,
+    ensure_job_tracking,
+)
 
 
 import logging
@@ -20,13 +28,115 @@ class MessageType:
     REQUESTJOB = "requestJob"
 
 
+# Atomically takes the next free sub-job and leases it to the requesting
+# wallet until ARGV[1].
+CLAIM_SUBJOB_SCRIPT = """
+local job_key = KEYS[1]
+local assignable_key = KEYS[2]
+local leases_key = KEYS[3]
+
+while true do
+    local popped = redis.call('ZPOPMIN', assignable_key)
+    if #popped == 0 then
+        return false
+    end
+    local file_hash = popped[1]
+    local raw = redis.call('HGET', job_key, file_hash)
+    if raw then
+        local data = cjson.decode(raw)
+        data['wallet'] = ARGV[2]
+        data['last_active'] = ARGV[3]
+        data['downloaded'] = '1'
+        redis.call('HSET', job_key, file_hash, cjson.encode(data))
+        redis.call('ZADD', leases_key, ARGV[1], file_hash)
+        return {file_hash, data['url']}
+    end
+end
+"""
+
+# Extends the lease of a sub-job while its holder is still uploading. A lease
+# that already expired is taken back as long as nobody else claimed it.
+RENEW_LEASE_SCRIPT = """
+local job_key = KEYS[1]
+local assignable_key = KEYS[2]
+local leases_key = KEYS[3]
+local file_hash = ARGV[1]
+
+local raw = redis.call('HGET', job_key, file_hash)
+if not raw or cjson.decode(raw)['wallet'] ~= ARGV[2] then
+    return 0
+end
+if redis.call('ZSCORE', leases_key, file_hash) then
+    redis.call('ZADD', leases_key, ARGV[3], file_hash)
+    return 1
+end
+if redis.call('ZREM', assignable_key, file_hash) == 1 then
+    redis.call('ZADD', leases_key, ARGV[3], file_hash)
+    return 1
+end
+return 0
+"""
+
+# Moves up to ARGV[2] leases that expired before ARGV[1] back to the
+# assignable set.
+SWEEP_LEASES_SCRIPT = """
+local assignable_key = KEYS[1]
+local leases_key = KEYS[2]
+
+local expired = redis.call(
+    'ZRANGEBYSCORE', leases_key, '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2])
+)
+for _, file_hash in ipairs(expired) do
+    redis.call('ZREM', leases_key, file_hash)
+    redis.call('ZADD', assignable_key, ARGV[1], file_hash)
+end
+return #expired
+"""
+
+claim_subjob = r.register_script(CLAIM_SUBJOB_SCRIPT)
+renew_subjob_lease = r.register_script(RENEW_LEASE_SCRIPT)
+sweep_subjob_leases = r.register_script(SWEEP_LEASES_SCRIPT)
+
+
+def job_keys(job_id):
+    return [job_id, assignable_key(job_id), leases_key(job_id)]
+
+
+def renew_lease(job_id, file_hash, wallet_address):
+    try:
+        expires_at = time.time() + get_lease_seconds(job_id)
+        renewed = renew_subjob_lease(
+            keys=job_keys(job_id), args=[file_hash, wallet_address, expires_at]
+        )
+        return bool(renewed)
+    except redis.RedisError as e:
+        logging.error(f"Redis error renewing lease for {file_hash}: {e}")
+        return False
+
+
+def sweep_expired_leases():
+    try:
+        active_mining_value = r.get("active_mining")
+        if not active_mining_value:
+            return 0
+
+        swept = sweep_subjob_leases(
+            keys=[assignable_key(active_mining_value), leases_key(active_mining_value)],
+            args=[time.time(), config.LEASE_SWEEP_BATCH],
+        )
+        if swept:
+            logging.info(f"Returned {swept} expired sub-job leases to the queue")
+        return swept
+    except redis.RedisError as e:
+        logging.error(f"Redis error sweeping leases: {e}")
+        return 0
+
+
 def update_jobs(new_wallet_address):
     # print("Inside of update_jobs")
     try:
         current_time = datetime.datetime.utcnow()
 
-        ten_minutes_ago = current_time - datetime.timedelta(minutes=1)
-
         active_mining_status = r.get("mining_status")
 
         if active_mining_status in [None, False, "False"]:
@@ -41,62 +151,32 @@ def update_jobs(new_wallet_address):
             logging.info("Error: 'active_mining' not found in Redis.")
             return None, None
 
-        file_hashes = r.hgetall(active_mining_value)
-        if not file_hashes:
+        if not r.exists(active_mining_value):
             logging.error(f"Error: No job found with ID {active_mining_value}.")
             return None, None
 
-        all_have_gradient = True
-
-        for file_hash, json_data in file_hashes.items():
-            try:
-                data = json.loads(json_data)
-                # print("DATA OF JOBS", data)
-            except json.JSONDecodeError:
-                print(f"Error: Could not decode JSON data for {file_hash}.")
-                continue
-
-            if "gradient" not in data or not data["gradient"]:
-                # print("Inside of if and else  gradient")
-                gradient_value = str(data.get("gradient"))
-                if gradient_value != "1":
-                    # print("gradient_value != 1 ? ", gradient_value)
-                    all_have_gradient = False
-
-                updated = False
-
-                try:
-                    last_active_time = datetime.datetime.fromisoformat(
-                        data.get("last_active")
-                    )
-
-                except TypeError:
-                    last_active_time = datetime.datetime.min
-
-                if "wallet" in data and last_active_time < ten_minutes_ago:
-                    data["wallet"] = new_wallet_address
-                    data["last_active"] = current_time.isoformat()
-                    data["downloaded"] = "1"
-                    updated = True
-                elif "wallet" not in data:
-                    data["wallet"] = new_wallet_address
-                    data["last_active"] = current_time.isoformat()
-                    data["downloaded"] = "1"
-                    updated = True
-
-                if updated:
-                    json_data = json.dumps(data)
-                    r.hset(active_mining_value, file_hash, json_data)
-                    return json.dumps(
-                        {
-                            "file_hash": file_hash,
-                            "url": data["url"],
-                            "active_mining_value": active_mining_value,
-                            "message_type": MessageType.DOWNLOADFILE,
-                        }
-                    )
-
-        if all_have_gradient:
+        ensure_job_tracking(active_mining_value)
+
+        claimed = claim_subjob(
+            keys=job_keys(active_mining_value),
+            args=[
+                time.time() + get_lease_seconds(active_mining_value),
+                new_wallet_address,
+                current_time.isoformat(),
+            ],
+        )
+        if claimed:
+            file_hash, url = claimed
+            return json.dumps(
+                {
+                    "file_hash": file_hash,
+                    "url": url,
+                    "active_mining_value": active_mining_value,
+                    "message_type": MessageType.DOWNLOADFILE,
+                }
+            )
+
+        if not r.scard(pending_key(active_mining_value)):
             logging.warning("All jobs were processed successfully")
             mining_status(False)
 
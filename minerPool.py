@@ -7,8 +7,9 @@ from datetime import datetime, timedelta, date
 import time
 import sys
 from pydantic import BaseModel
-from database.mongodb import test_db_connection
-from database.database import test_redis_connection
+from typing import Optional
+from database.mongodb import test_db_connection, ensure_indexes, report_indexes
+from database.database import r, test_redis_connection
 from api.api_client import test_api_connection
 import os
 import logging
@@ -16,6 +17,10 @@ from dotenv import load_dotenv
 from utils.userdata import check_active_users, check_wallet_active
 import base58
 from transactions.updateGradient import clean_job_folder
+from transactions.gradientWriter import gradient_writer
+from core.pool import model_pool
+from mining.migrateMiners import LEGACY_MINERS_LIST, migrate_miners_list
+from mining.updateMiner import trim_active_miners
 
 active_connections = set()
 MAX_CONNECTIONS = 1500
@@ -27,8 +32,9 @@ logging.basicConfig(
     level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
 )
 
-from jobs.updateJob import update_jobs
-from transactions.updateGradient import update_gradient
+from jobs.updateJob import update_jobs, renew_lease, sweep_expired_leases
+from transactions.updateGradient import update_gradient, finalize_pending_jobs
+from transactions.payoutLedger import WITHDRAW_FIELDS
 from transactions.transactionBatch import (
     add_transaction_to_batch,
     process_all_transactions,
@@ -44,6 +50,7 @@ from jobs.fetchBlock import (
 
 
 from fastapi import FastAPI, HTTPException, Query, Request, Depends
+from fastapi.responses import JSONResponse
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -75,6 +82,7 @@ if minerpool_reward_address is None:
 
 class MessageType:
     GRADIENT = "gradient"
+    GRADIENTUPLOAD = "gradientUpload"
     REQUESTFILE = "requestFile"
     REQUESTJOB = "requestJob"
 
@@ -192,36 +200,92 @@ async def poolowner_deduct_balance(
         return {"message": f"Amount deducted successfully: {response}"}
 
 
+@app.get("/gradient-writer")
+@limiter.limit(config.RATE_LIMIT1)
+def get_gradient_writer_metrics(request: Request):
+    return gradient_writer.metrics()
+
+
 @app.get("/latestwithdraws/")
 @limiter.limit(config.RATE_LIMIT1)
-async def latest_withdraws(request: Request, wallet_address: str):
+async def latest_withdraws(
+    request: Request,
+    wallet_address: str,
+    limit: int = Query(
+        config.LATEST_WITHDRAWS_LIMIT, ge=1, le=config.LATEST_WITHDRAWS_MAX_LIMIT
+    ),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
     if not wallet_address:
         raise HTTPException(status_code=400, detail="Wallet address must be provided")
 
-    result = get_miner_TransactionsPushed(wallet_address)
+    if fields:
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in fields if field not in WITHDRAW_FIELDS]
+        if unknown:
+            raise HTTPException(
+                status_code=400, detail=f"Unknown fields: {', '.join(unknown)}"
+            )
+
+    result = await asyncio.to_thread(
+        get_miner_TransactionsPushed, wallet_address, limit, cursor, fields
+    )
 
     if not result.get("success", False):
         message = result.get("message", "An unexpected error occurred")
-        status_code = 404 if "No details found" in message else 500
+        if "No details found" in message:
+            status_code = 404
+        elif "Invalid cursor" in message:
+            status_code = 400
+        else:
+            status_code = 500
         raise HTTPException(status_code=status_code, detail=message)
-    return result.get("data", {})
+    # The page only holds JSON types already, so it skips FastAPI's encoder.
+    return JSONResponse(content=result.get("data", {}))
 
 
 async def periodic_process_transactions():
     while True:
-        process_transactions()
-        await asyncio.sleep(config.CHECK_INTERVAL)
+        caught_up = await asyncio.to_thread(process_transactions)
+        # While behind the chain tip the next batch is processed right away.
+        await asyncio.sleep(config.CHECK_INTERVAL if caught_up else 0)
+
+
+async def periodic_sweep_leases():
+    while True:
+        try:
+            await asyncio.to_thread(sweep_expired_leases)
+        except Exception as e:
+            logging.error(f"Error sweeping expired leases: {e}")
+        await asyncio.sleep(config.LEASE_SWEEP_INTERVAL)
+
+
+async def periodic_finalize_jobs():
+    while True:
+        try:
+            await finalize_pending_jobs()
+        except Exception as e:
+            logging.error(f"Error finalizing jobs: {e}")
+        await asyncio.sleep(config.FINALIZE_RETRY_INTERVAL)
 
 
-def save_file_chunk_in_job_folder(chunk, folder_name, file_name, is_first_chunk):
-    folder_name = os.path.basename(folder_name)
+async def periodic_trim_active_miners():
+    while True:
+        try:
+            trim_active_miners()
+        except Exception as e:
+            logging.error(f"Error trimming active miners: {e}")
+        await asyncio.sleep(config.ACTIVE_MINERS_TRIM_INTERVAL)
 
-    folder_path = os.path.join("Job", folder_name)
-    os.makedirs(folder_path, exist_ok=True)
-    file_path = os.path.join(folder_path, file_name)
 
-    with open(file_path, "ab" if not is_first_chunk else "wb") as file:
-        file.write(chunk)
+def renew_upload_lease(job_name, just_name, wallet_address, renewed_at):
+    # Keeps the sub-job leased to a miner that is still uploading it.
+    now = time.monotonic()
+    if now - renewed_at < config.LEASE_RENEW_INTERVAL:
+        return renewed_at
+    renew_lease(job_name, just_name, wallet_address)
+    return now
 
 
 def update_balance_periodically():
@@ -254,6 +318,45 @@ def is_valid_address(address: str) -> bool:
         return False
 
 
+def parse_upload_header(parsed_message):
+    job_name = parsed_message.get("job_name")
+    file_name = parsed_message.get("file_name")
+    just_name = parsed_message.get("just_name")
+    file_size = parsed_message.get("file_size")
+
+    if not job_name or not file_name or not just_name:
+        return None
+    if not isinstance(file_size, int) or isinstance(file_size, bool):
+        return None
+    if file_size <= 0 or file_size > config.MAX_GRADIENT_SIZE:
+        return None
+
+    return {
+        "job_name": job_name,
+        "folder_name": parsed_message.get("folder_name") or job_name,
+        "file_name": file_name,
+        "just_name": just_name,
+        "wallet_address": parsed_message.get("wallet_address"),
+        "file_size": file_size,
+        "received": 0,
+        "renewed_at": 0,
+    }
+
+
+async def finalize_gradient_upload(
+    websocket, job_name, just_name, wallet_address, file_name
+):
+    success, message = await update_gradient(
+        job_name, just_name, "1", wallet_address, file_name
+    )
+    if success:
+        await websocket.send("SUCCESS: GRADIENT ACCEPTED")
+    else:
+        await websocket.send(f"ERROR: {message}")
+    await websocket.close()
+    active_connections.discard(websocket)
+
+
 async def handle_client(websocket, path):
     global active_connections
     num_active_connections = len(active_connections)
@@ -262,9 +365,52 @@ async def handle_client(websocket, path):
         await websocket.close(reason="ERROR: Connection limit reached")
         return
     active_connections.add(websocket)
+    # Binary uploads send a "gradientUpload" JSON header first, then the
+    # file as raw binary frames which are written straight to disk.
+    upload = None
+    file_upload = None
+    lease_renewed_at = 0
     try:
         async for message in websocket:
             try:
+                if isinstance(message, bytes):
+                    if upload is None:
+                        await websocket.send("ERROR: Unexpected binary frame")
+                        await websocket.close()
+                        active_connections.discard(websocket)
+                        continue
+
+                    if upload["received"] + len(message) > upload["file_size"]:
+                        await websocket.send(
+                            "ERROR: Upload exceeds declared file size"
+                        )
+                        await websocket.close()
+                        active_connections.discard(websocket)
+                        upload = None
+                        continue
+
+                    await gradient_writer.write(file_upload, message)
+                    upload["received"] += len(message)
+                    upload["renewed_at"] = renew_upload_lease(
+                        upload["job_name"],
+                        upload["just_name"],
+                        upload["wallet_address"],
+                        upload["renewed_at"],
+                    )
+
+                    if upload["received"] == upload["file_size"]:
+                        completed, upload = upload, None
+                        await gradient_writer.close(file_upload)
+                        file_upload = None
+                        await finalize_gradient_upload(
+                            websocket,
+                            completed["job_name"],
+                            completed["just_name"],
+                            completed["wallet_address"],
+                            completed["file_name"],
+                        )
+                    continue
+
                 parsed_message = json.loads(message)
                 message_type = parsed_message.get("type")
                 wallet_address = parsed_message.get("wallet_address")
@@ -285,22 +431,38 @@ async def handle_client(websocket, path):
 
                     if file_chunk == b"EOF":
                         # print(f"Completed receiving {file_name}")
+                        if file_upload is not None:
+                            await gradient_writer.close(file_upload)
+                            file_upload = None
 
-                        success, message = update_gradient(
-                            job_name, just_name, "1", wallet_address, file_name
+                        await finalize_gradient_upload(
+                            websocket, job_name, just_name, wallet_address, file_name
                         )
-                        if success:
-                            await websocket.send("SUCCESS: GRADIENT ACCEPTED")
-                            await websocket.close()
-                            active_connections.discard(websocket)
-                        else:
-                            await websocket.send(f"ERROR: {message}")
-                            await websocket.close()
-                            active_connections.discard(websocket)
                     else:
                         is_first_chunk = parsed_message.get("is_first_chunk", False)
-                        save_file_chunk_in_job_folder(
-                            file_chunk, folder_name, file_name, is_first_chunk
+                        if file_upload is None or is_first_chunk:
+                            if file_upload is not None:
+                                await gradient_writer.abort(file_upload)
+                            file_upload = await gradient_writer.open(
+                                folder_name, file_name, truncate=is_first_chunk
+                            )
+                        await gradient_writer.write(file_upload, file_chunk)
+                        lease_renewed_at = renew_upload_lease(
+                            job_name, just_name, wallet_address, lease_renewed_at
+                        )
+
+                elif message_type == "gradientUpload":
+                    if file_upload is not None:
+                        await gradient_writer.abort(file_upload)
+                        file_upload = None
+                    upload = parse_upload_header(parsed_message)
+                    if upload is None:
+                        await websocket.send("ERROR: Invalid upload header")
+                        await websocket.close()
+                        active_connections.discard(websocket)
+                    else:
+                        file_upload = await gradient_writer.open(
+                            upload["folder_name"], upload["file_name"]
                         )
 
                 elif message_type == "requestFile":
@@ -341,12 +503,19 @@ async def handle_client(websocket, path):
                 await websocket.send("ERROR: Invalid message format")
                 await websocket.close()
                 active_connections.discard(websocket)
+            except OSError as e:
+                logging.error(f"Error storing gradient chunk: {e}")
+                await websocket.send("ERROR: Failed to store gradient")
+                await websocket.close()
+                active_connections.discard(websocket)
 
     except websockets.ConnectionClosed:
         logging.error("Client disconnected")
         active_connections.discard(websocket)
         # Handle disconnection
     finally:
+        if file_upload is not None:
+            await gradient_writer.abort(file_upload)
         await websocket.wait_closed()
         # logging.info("WebSocket connection closed by the client.")
         # logging.info(f"Before Client disconnected {len(active_connections)}")
@@ -366,8 +535,11 @@ async def main():
     start_server = websockets.serve(handle_client, config.IP, config.PORT)
     await start_server
 
-    # Start the periodic task
+    # Start the periodic tasks
     periodic_task = asyncio.create_task(periodic_process_transactions())
+    sweep_task = asyncio.create_task(periodic_sweep_leases())
+    trim_task = asyncio.create_task(periodic_trim_active_miners())
+    finalize_task = asyncio.create_task(periodic_finalize_jobs())
 
     try:
         await asyncio.Future()
@@ -375,7 +547,17 @@ async def main():
     finally:
         logging.info("MinerPool shutdown process starting.")
         periodic_task.cancel()
-        await periodic_task
+        sweep_task.cancel()
+        trim_task.cancel()
+        finalize_task.cancel()
+        await asyncio.gather(
+            periodic_task,
+            sweep_task,
+            trim_task,
+            finalize_task,
+            return_exceptions=True,
+        )
+        model_pool.shutdown()
         logging.info("MinerPool shutdown process complete.")
 
 
@@ -383,9 +565,19 @@ if __name__ == "__main__":
     if not test_db_connection():
         logging.error("Failed to establish MongoDB connection. Exiting...")
         sys.exit(1)
+    ensure_indexes()
+    report_indexes()
     if not test_redis_connection():
         logging.error("Failed to establish Redis connection. Exiting...")
         sys.exit(2)
+    if r.exists(LEGACY_MINERS_LIST):
+        # Balances left in miners_list are unreadable until they are migrated.
+        logging.info("Migrating the miners still stored in miners_list.")
+        migrated, failed = migrate_miners_list()
+        if failed:
+            logging.warning(
+                f"{failed} miners could not be migrated and stay in miners_list."
+            )
     if not test_api_connection(config.API_URL):
         logging.error("Failed to establish API connection. Exiting...")
         sys.exit(3)
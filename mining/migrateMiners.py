@@ -0,0 +1,83 @@
+from database.database import r, test_redis_connection
+from mining.updateMiner import (
+    ACTIVE_MINERS,
+    MINERS_INDEX,
+    activity_score,
+    miner_key,
+)
+from utils.money import to_units
+import json
+import logging
+import redis
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+LEGACY_MINERS_LIST = "miners_list"
+
+
+def legacy_balance_units(miner_data):
+    if "balance_units" in miner_data:
+        return int(miner_data["balance_units"])
+    return to_units(miner_data.get("balance", 0))
+
+
+def migrate_miner(wallet):
+    """
+    Moves one miners_list entry into its miner hash. The entry is merged into
+    a hash that already exists (balances and scores are added) and removed
+    from miners_list in the same transaction, so a rerun never counts it twice.
+    """
+    with r.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(LEGACY_MINERS_LIST)
+                raw = pipe.hget(LEGACY_MINERS_LIST, wallet)
+                if raw is None:
+                    pipe.unwatch()
+                    return False
+                miner_data = json.loads(raw)
+                last_active_time = miner_data.get("last_active_time")
+                try:
+                    last_active = activity_score(last_active_time)
+                except (TypeError, ValueError):
+                    last_active = None
+
+                pipe.multi()
+                pipe.hincrby(
+                    miner_key(wallet), "balance_units", legacy_balance_units(miner_data)
+                )
+                pipe.hincrby(miner_key(wallet), "score", int(miner_data.get("score", 0)))
+                if last_active_time is not None:
+                    pipe.hsetnx(miner_key(wallet), "last_active_time", last_active_time)
+                if last_active is not None:
+                    pipe.zadd(ACTIVE_MINERS, {wallet: last_active}, nx=True)
+                pipe.sadd(MINERS_INDEX, wallet)
+                pipe.hdel(LEGACY_MINERS_LIST, wallet)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                continue
+
+
+def migrate_miners_list():
+    migrated = 0
+    failed = 0
+    for wallet in r.hkeys(LEGACY_MINERS_LIST):
+        try:
+            if migrate_miner(wallet):
+                migrated += 1
+        except (ValueError, json.JSONDecodeError) as e:
+            failed += 1
+            logging.error(f"Could not migrate miner {wallet}: {e}")
+
+    logging.info(f"Migrated {migrated} miners, {failed} entries left in miners_list.")
+    return migrated, failed
+
+
+if __name__ == "__main__":
+    if not test_redis_connection():
+        logging.error("Redis connection is not established.")
+    else:
+        migrate_miners_list()
@@ -1,47 +1,53 @@
 from database.database import r
-import json
+import utils.config as config
 import logging
+import time
+from datetime import datetime, timezone
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
 )
 
+# Every miner is stored in its own hash with the fields balance_units, score
+# and last_active_time; MINERS_INDEX is the set of all known wallets.
+MINERS_INDEX = "miners"
+# Sorted set of wallets scored by the epoch seconds of their last activity.
+ACTIVE_MINERS = "miners:active"
+
+
+def miner_key(wallet):
+    return f"miner:{wallet}"
+
+
+def get_miner(wallet):
+    return r.hgetall(miner_key(wallet))
+
+
+def activity_score(last_active_time):
+    """Converts a naive UTC last_active_time string to epoch seconds."""
+    last_active = datetime.fromisoformat(str(last_active_time))
+    return last_active.replace(tzinfo=timezone.utc).timestamp()
+
+
+def trim_active_miners():
+    """Drops the miners that have been inactive for longer than the window."""
+    cutoff = time.time() - config.ACTIVE_MINER_WINDOW
+    return r.zremrangebyscore(ACTIVE_MINERS, "-inf", f"({cutoff}")
+
 
 def update_miner(wallet, score, last_active_time):
     try:
-        if not r.exists("miners_list"):
-            r.hset(
-                "miners_list",
-                wallet,
-                json.dumps(
-                    {"balance": 0, "score": score, "last_active_time": last_active_time}
-                ),
-            )
+        last_active = activity_score(last_active_time)
+        pipe = r.pipeline()
+        pipe.zadd(ACTIVE_MINERS, {wallet: last_active})
+        pipe.hincrby(miner_key(wallet), "score", int(score))
+        pipe.hset(miner_key(wallet), "last_active_time", last_active_time)
+        pipe.hsetnx(miner_key(wallet), "balance_units", 0)
+        pipe.sadd(MINERS_INDEX, wallet)
+        added = pipe.execute()[-1]
+        if added:
             return True, "Miner data added successfully."
-        else:
-            miner_data = r.hget("miners_list", wallet)
-            if miner_data:
-                miner_data = json.loads(miner_data)
-                miner_data["score"] = str(int(miner_data["score"]) + int(score))
-                miner_data["last_active_time"] = last_active_time
-                r.hset("miners_list", wallet, json.dumps(miner_data))
-                return True, "Miner updated successfully."
-            else:
-                r.hset(
-                    "miners_list",
-                    wallet,
-                    json.dumps(
-                        {
-                            "balance": 0,
-                            "score": score,
-                            "last_active_time": last_active_time,
-                        }
-                    ),
-                )
-                return True, "Miner score updated successfully."
-    except json.JSONDecodeError:
-        logging.error("Error in processing JSON data.")
-        return False, "Failed to process JSON data."
+        return True, "Miner updated successfully."
     except ValueError as e:
         logging.error(f"Value error: {e}")
         return False, f"Value error: {e}"
@@ -1,6 +1,7 @@
 import logging
 from decimal import Decimal
 import requests
+from api import http_client
 from upow_transactions.helpers import string_to_point, round_up_decimal
 from upow_transactions.transaction_input import TransactionInput
 
@@ -19,7 +20,7 @@ class WalletRepository:
         inode_registration_outputs: bool = False,
         validator_unspent_votes: bool = False,
     ):
-        request = requests.get(
+        request = http_client.get(
             f"{self.node_url}/get_address_info",
             {
                 "address": address,
@@ -58,7 +59,7 @@ class WalletRepository:
         return result
 
     def get_dobby_info(self):
-        request = requests.get(f"{self.node_url}/dobby_info")
+        request = http_client.get(f"{self.node_url}/dobby_info")
         request.raise_for_status()
         result = request.json()["result"]
         return result
@@ -250,7 +251,7 @@ class WalletRepository:
         """
         try:
             # Send the request to the node
-            request = requests.get(
+            request = http_client.get(
                 f"{self.node_url}/get_address_info",
                 params={"address": address, "show_pending": True},
             )
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import utils.config as config
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+
+class GradientUpload:
+    def __init__(self, file_path, queue_size):
+        self.file_path = file_path
+        self.file = None
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.task = None
+        self.error = None
+
+
+class GradientWriter:
+    """
+    Writes gradient chunks to disk without blocking the websocket event loop.
+
+    Every upload keeps its file handle open and has a bounded queue drained by
+    its own task. Pending chunks are coalesced into a single write that runs on
+    a shared thread pool, and a full queue makes the sender wait (backpressure).
+    """
+
+    def __init__(self, max_workers, queue_size):
+        self.queue_size = queue_size
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="gradient-writer"
+        )
+        self.uploads = set()
+        self.writes = 0
+        self.bytes_written = 0
+        self.total_write_time = 0.0
+        self.max_write_time = 0.0
+        self.last_write_time = 0.0
+
+    async def open(self, folder_name, file_name, truncate=True):
+        folder_path = os.path.join("Job", os.path.basename(folder_name))
+        file_path = os.path.join(folder_path, os.path.basename(file_name))
+        upload = GradientUpload(file_path, self.queue_size)
+
+        loop = asyncio.get_running_loop()
+        upload.file = await loop.run_in_executor(
+            self.executor, _open_file, folder_path, file_path, truncate
+        )
+        upload.task = asyncio.create_task(self._drain(upload))
+        self.uploads.add(upload)
+        return upload
+
+    async def write(self, upload, chunk):
+        if upload.error is not None:
+            raise upload.error
+        await upload.queue.put(chunk)
+
+    async def close(self, upload):
+        """Flushes every queued chunk and closes the file handle."""
+        if upload not in self.uploads:
+            return
+        await upload.queue.put(None)
+        try:
+            await upload.task
+        finally:
+            self.uploads.discard(upload)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, upload.file.close)
+        if upload.error is not None:
+            raise upload.error
+
+    async def abort(self, upload):
+        """Closes an unfinished upload, e.g. when the miner disconnects."""
+        try:
+            await self.close(upload)
+        except Exception as e:
+            logging.error(f"Error closing upload {upload.file_path}: {e}")
+
+    async def _drain(self, upload):
+        loop = asyncio.get_running_loop()
+        finished = False
+        while not finished:
+            chunks = [await upload.queue.get()]
+            while not upload.queue.empty():
+                chunks.append(upload.queue.get_nowait())
+            if chunks[-1] is None:
+                chunks.pop()
+                finished = True
+            if not chunks or upload.error is not None:
+                continue
+
+            data = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+            started = time.perf_counter()
+            try:
+                await loop.run_in_executor(self.executor, upload.file.write, data)
+            except Exception as e:
+                logging.error(f"Error writing chunk to {upload.file_path}: {e}")
+                upload.error = e
+                continue
+            self._record_write(len(data), time.perf_counter() - started)
+
+    def _record_write(self, size, elapsed):
+        self.writes += 1
+        self.bytes_written += size
+        self.total_write_time += elapsed
+        self.last_write_time = elapsed
+        self.max_write_time = max(self.max_write_time, elapsed)
+
+    def metrics(self):
+        uploads = list(self.uploads)
+        average = self.total_write_time / self.writes if self.writes else 0.0
+        return {
+            "open_uploads": len(uploads),
+            "queue_depth": sum(upload.queue.qsize() for upload in uploads),
+            "writes": self.writes,
+            "bytes_written": self.bytes_written,
+            "avg_write_ms": round(average * 1000, 3),
+            "max_write_ms": round(self.max_write_time * 1000, 3),
+            "last_write_ms": round(self.last_write_time * 1000, 3),
+        }
+
+
+def _open_file(folder_path, file_path, truncate):
+    os.makedirs(folder_path, exist_ok=True)
+    return open(file_path, "wb" if truncate else "ab")
+
+
+gradient_writer = GradientWriter(
+    config.GRADIENT_WRITER_THREADS, config.GRADIENT_WRITER_QUEUE_SIZE
+)
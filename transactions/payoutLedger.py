@@ -0,0 +1,149 @@
+from database.mongodb import payoutLedger, minerTransactionsPushed, ensure_indexes
+from pymongo import DESCENDING, UpdateOne
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime, timedelta
+import logging
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+# Every payout event is one document of payoutLedger:
+# {payout_id, wallet_address, event, amount, transaction_type, timestamp}
+# plus the hash of "pushed" events and the error of "error" events.
+ATTEMPT = "attempt"
+PUSHED = "pushed"
+ERROR = "error"
+
+# Fields a client may ask /latestwithdraws/ for, by their name in the answer.
+WITHDRAW_FIELDS = {
+    "id": "payout_id",
+    "hash": "hash",
+    "amount": "amount",
+    "timestamp": "timestamp",
+    "transaction_type": "transaction_type",
+}
+EPOCH = datetime(1970, 1, 1)
+
+
+class PayoutLedger:
+    """
+    Collects the payout events of a batch in memory and appends them to
+    payoutLedger with a single insert_many on flush.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def record(self, event, transaction, amount, **fields):
+        self.events.append(
+            {
+                "payout_id": transaction.get("id"),
+                "wallet_address": transaction.get("wallet_address"),
+                "event": event,
+                "amount": amount,
+                "transaction_type": transaction.get("type"),
+                "timestamp": datetime.utcnow(),
+                **fields,
+            }
+        )
+
+    def flush(self):
+        events, self.events = self.events, []
+        if events:
+            payoutLedger.insert_many(events, ordered=False)
+        return len(events)
+
+
+def encode_cursor(event):
+    milliseconds = (event["timestamp"] - EPOCH) // timedelta(milliseconds=1)
+    return f"{milliseconds}-{event['_id']}"
+
+
+def decode_cursor(cursor):
+    try:
+        milliseconds, event_id = cursor.split("-", 1)
+        return EPOCH + timedelta(milliseconds=int(milliseconds)), ObjectId(event_id)
+    except (ValueError, InvalidId) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def get_pushed_payouts(wallet_address, limit, cursor=None, fields=None):
+    """
+    Returns up to limit pushed payouts of a wallet, newest first, and the
+    cursor of the next page (None on the last one). Only fields are read
+    from MongoDB, all of WITHDRAW_FIELDS by default. The page is an index
+    range scan on (wallet_address, event, timestamp, _id), so its cost does
+    not depend on how many payouts the wallet has.
+    """
+    fields = fields or list(WITHDRAW_FIELDS)
+    query = {"wallet_address": wallet_address, "event": PUSHED}
+    if cursor:
+        timestamp, event_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": event_id}},
+        ]
+    projection = {WITHDRAW_FIELDS[field]: 1 for field in fields}
+    projection["timestamp"] = 1
+
+    # One extra document tells whether there is a next page.
+    events = list(
+        payoutLedger.find(query, projection)
+        .sort([("timestamp", DESCENDING), ("_id", DESCENDING)])
+        .limit(limit + 1)
+    )
+    next_cursor = encode_cursor(events[limit - 1]) if len(events) > limit else None
+
+    withdraws = []
+    for event in events[:limit]:
+        withdraw = {field: event.get(WITHDRAW_FIELDS[field]) for field in fields}
+        if "timestamp" in withdraw:
+            withdraw["timestamp"] = withdraw["timestamp"].isoformat()
+        withdraws.append(withdraw)
+    return withdraws, next_cursor
+
+
+def migrate_pushed_history():
+    """
+    Copies the withdrawals stored in the per-wallet arrays of
+    minerTransactionsPushed into payoutLedger, then drops those documents.
+    Every withdrawal is upserted on a legacy_key made of its document and
+    position, so rerunning an interrupted migration does not copy it twice.
+    """
+    migrated = 0
+    for wallet_details in minerTransactionsPushed.find():
+        wallet_address = wallet_details.get("wallet_address")
+        operations = [
+            UpdateOne(
+                {"legacy_key": f"{wallet_details['_id']}:{position}"},
+                {
+                    "$setOnInsert": {
+                        "payout_id": transaction.get("id"),
+                        "wallet_address": wallet_address,
+                        "event": PUSHED,
+                        "amount": transaction.get("amount"),
+                        "transaction_type": transaction.get("transaction_type"),
+                        "timestamp": transaction.get("timestamp"),
+                        "hash": transaction.get("hash"),
+                    }
+                },
+                upsert=True,
+            )
+            for position, transaction in enumerate(
+                wallet_details.get("transactions", [])
+            )
+        ]
+        if operations:
+            payoutLedger.bulk_write(operations, ordered=False)
+        minerTransactionsPushed.delete_one({"_id": wallet_details["_id"]})
+        migrated += len(operations)
+
+    logging.info(f"Migrated {migrated} withdrawals to payoutLedger.")
+    return migrated
+
+
+if __name__ == "__main__":
+    ensure_indexes()
+    migrate_pushed_history()
@@ -3,19 +3,33 @@ import uuid
 from database.database import r
 import logging
 import json
-from datetime import datetime
+import random
+from bisect import bisect_left
+from itertools import accumulate
+from datetime import datetime, timedelta
 import utils.config as config
 import asyncio
+from pymongo import ASCENDING
 from database.mongodb import (
     minerTransactionsCollection,
-    minerTransactionsPushed,
-    errorTransaction,
-    catchTransaction,
-    pushHistory,
+    payoutDeadLetter,
+    payoutLedger,
 )
-from api.push import send_transaction
+from api.push import node_breaker, push_tx, wallet_utils
 from decimal import Decimal, ROUND_DOWN
 from api.api_client import test_api_connection
+from concurrent.futures import ThreadPoolExecutor
+from fastecdsa import keys
+from upow_transactions.constants import CURVE
+from upow_transactions.helpers import point_to_string
+from utils.utxocache import UtxoCache
+from utils.money import to_units, from_units, split_units
+from utils.errors import (
+    InsufficientFundsError,
+    NodeUnavailableError,
+)
+from upow_transactions.transaction import TooManyInputsError
+from transactions.payoutLedger import PayoutLedger, ATTEMPT, PUSHED, ERROR
 
 
 logging.basicConfig(
@@ -23,175 +37,513 @@ logging.basicConfig(
 )
 
 
+signing_executor = ThreadPoolExecutor(
+    max_workers=config.PAYOUT_SIGNING_THREADS, thread_name_prefix="payout-signer"
+)
+
+pool_private_key = int(config.PRIVATEKEY, 16)
+pool_address = point_to_string(keys.get_public_key(pool_private_key, CURVE))
+pool_utxos = UtxoCache(
+    pool_address, config.UTXO_CACHE_TTL, wallet_utils.get_spendable_inputs
+)
+
+# Withdrawals wait in minerTransactionsCollection as "pending" until a batch
+# claims them ("processing"). A pushed payout is deleted, a failed one goes
+# back to "pending" with its next attempt delayed by exponential backoff.
+# Documents queued before the status field existed count as pending. The
+# queue indexes are declared in database.mongodb.INDEXES.
+PENDING = "pending"
+PROCESSING = "processing"
+
+# Ids of payouts pushed to the node that could not be removed from the
+# queue yet. They must never be released or retried.
+settled_payout_ids = set()
+
+
+def claim_payouts(limit):
+    """
+    Claims up to limit due payouts, oldest first, in three round trips: the
+    ids of the candidates are read, the ones still due are stamped with a
+    claim token by one update_many, and the claimed payouts are read back by
+    that token. A payout claimed by someone else in between no longer
+    matches the update, so it is never claimed twice.
+    """
+    now = datetime.utcnow()
+    due = {
+        "status": {"$in": [PENDING, None]},
+        "$or": [
+            {"next_attempt_at": {"$lte": now}},
+            {"next_attempt_at": {"$exists": False}},
+        ],
+    }
+    candidate_ids = [
+        transaction["_id"]
+        for transaction in minerTransactionsCollection.find(due, {"_id": 1})
+        .sort("timestamp", ASCENDING)
+        .limit(limit)
+    ]
+    if not candidate_ids:
+        return []
+
+    claim_token = uuid.uuid4().hex
+    minerTransactionsCollection.update_many(
+        {"_id": {"$in": candidate_ids}, **due},
+        {
+            "$set": {
+                "status": PROCESSING,
+                "claimed_at": now,
+                "claim_token": claim_token,
+            }
+        },
+    )
+    return list(
+        minerTransactionsCollection.find({"claim_token": claim_token}).sort(
+            "timestamp", ASCENDING
+        )
+    )
+
+
+def complete_payouts(transactions):
+    ids = [transaction.get("id") for transaction in transactions]
+    if ids:
+        minerTransactionsCollection.delete_many({"id": {"$in": ids}})
+
+
+def complete_settled_payouts():
+    """Retries removing the payouts pushed by earlier batches from the queue."""
+    if not settled_payout_ids:
+        return
+    ids = list(settled_payout_ids)
+    minerTransactionsCollection.delete_many({"id": {"$in": ids}})
+    settled_payout_ids.difference_update(ids)
+
+
+def release_payouts(transactions, delay=0):
+    """
+    Puts claimed payouts back in the queue without counting an attempt, due
+    again in delay seconds.
+    """
+    ids = [transaction.get("id") for transaction in transactions]
+    if ids:
+        next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        minerTransactionsCollection.update_many(
+            {"id": {"$in": ids}, "status": PROCESSING},
+            {
+                "$set": {"status": PENDING, "next_attempt_at": next_attempt_at},
+                "$unset": {"claimed_at": "", "claim_token": ""},
+            },
+        )
+
+
+def retry_delay(attempts):
+    delay = min(
+        config.PAYOUT_RETRY_BASE_DELAY * 2 ** (attempts - 1),
+        config.PAYOUT_RETRY_MAX_DELAY,
+    )
+    return delay * random.uniform(0.5, 1.0)
+
+
+def retry_payout(transaction, error_message, failures=None, alone=False):
+    """
+    Puts a failed payout back in the queue after an exponential backoff.
+    failures, when given, is the number of failures that count towards
+    dead-lettering the payout. alone makes its next attempt a transaction
+    of its own.
+    """
+    attempts = transaction.get("attempts", 0) + 1
+    next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_delay(attempts))
+    update = {
+        "status": PENDING,
+        "attempts": attempts,
+        "next_attempt_at": next_attempt_at,
+        "last_error": error_message,
+    }
+    if failures is not None:
+        update["failures"] = failures
+    if alone:
+        update["alone"] = True
+    minerTransactionsCollection.update_one(
+        {"id": transaction.get("id")},
+        {"$set": update, "$unset": {"claimed_at": "", "claim_token": ""}},
+    )
+
+
+def dead_letter_payout(transaction, error_message):
+    """
+    Moves a payout that keeps failing out of the queue into payoutDeadLetter,
+    where it waits to be looked at instead of being retried forever.
+    """
+    document = {key: value for key, value in transaction.items() if key != "_id"}
+    document["status"] = "dead"
+    document["error"] = error_message
+    document["dead_lettered_at"] = datetime.utcnow()
+    payoutDeadLetter.insert_one(document)
+    minerTransactionsCollection.delete_one({"id": transaction.get("id")})
+
+
+def reclaim_stale_payouts():
+    """
+    Returns to the queue the payouts claimed by a batch that never finished
+    them, e.g. because the pool was stopped in the middle of it. Those the
+    payout ledger records as pushed were paid and are removed instead.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=config.PAYOUT_CLAIM_TIMEOUT)
+    stale = {"status": PROCESSING, "claimed_at": {"$lt": cutoff}}
+    stale_ids = [
+        transaction["id"]
+        for transaction in minerTransactionsCollection.find(stale, {"id": 1})
+    ]
+    if not stale_ids:
+        return
+    pushed_ids = payoutLedger.distinct(
+        "payout_id", {"payout_id": {"$in": stale_ids}, "event": PUSHED}
+    )
+    if pushed_ids:
+        logging.warning(f"Removing {len(pushed_ids)} stale payouts already pushed.")
+        minerTransactionsCollection.delete_many({"id": {"$in": pushed_ids}})
+    result = minerTransactionsCollection.update_many(
+        stale,
+        {"$set": {"status": PENDING}, "$unset": {"claimed_at": "", "claim_token": ""}},
+    )
+    if result.modified_count:
+        logging.warning(f"Reclaimed {result.modified_count} stale payouts.")
+
+
+# Conservative hex sizes of the parts of a payout transaction: version,
+# counts, message flag and one signature, an input, and an output with the
+# longest address, amount and type.
+TX_HEX_OVERHEAD = 2 * 4 + 128
+INPUT_HEX_SIZE = 2 * 34
+OUTPUT_HEX_SIZE = 2 * 75
+
+
+class PayoutGroup:
+    """Payouts settled by one chain transaction, and the inputs funding it."""
+
+    def __init__(self):
+        self.payouts = []
+        self.inputs = []
+
+    @property
+    def total(self):
+        return sum(amount for _, amount in self.payouts)
+
+    @property
+    def recipients(self):
+        return [transaction.get("wallet_address") for transaction, _ in self.payouts]
+
+    @property
+    def amounts(self):
+        return [amount for _, amount in self.payouts]
+
+
+def estimate_hex_size(num_inputs, num_outputs):
+    return TX_HEX_OVERHEAD + num_inputs * INPUT_HEX_SIZE + num_outputs * OUTPUT_HEX_SIZE
+
+
+def max_transaction_inputs(num_recipients):
+    """
+    Returns how many inputs a transaction paying num_recipients (plus change)
+    may spend within the input and push size limits, 0 when the recipients
+    alone do not fit.
+    """
+    if num_recipients > config.PAYOUT_MAX_RECIPIENTS:
+        return 0
+    room = config.PAYOUT_MAX_TX_HEX - estimate_hex_size(0, num_recipients + 1)
+    return max(0, min(255, room // INPUT_HEX_SIZE))
+
+
+def largest_first_totals(inputs):
+    """Running totals of the input amounts, largest first."""
+    return list(accumulate(sorted((i.amount for i in inputs), reverse=True)))
+
+
+def plan_payouts(transactions, inputs):
+    """
+    Packs the payouts, in queue order, into groups settled by one
+    multi-recipient transaction each. A group grows while its inputs and
+    outputs (plus change) stay within the transaction and push size limits.
+    Every group spends its own inputs out of the pool wallet's spendable
+    outputs, so no two transactions of a batch can spend the same output.
+    Payouts marked alone (their last multi-recipient transaction was
+    rejected) get a group of their own. Returns the groups and the payouts
+    that could not be funded.
+
+    While a group grows, the number of inputs it needs is the number of
+    largest inputs covering its total, a binary search over their running
+    totals. Coin selection runs once per group, when it is closed.
+    """
+    available = list(inputs)
+    totals = largest_first_totals(available)
+    groups = []
+    deferred = []
+    group = PayoutGroup()
+
+    def inputs_needed(amount):
+        position = bisect_left(totals, amount)
+        return position + 1 if position < len(totals) else None
+
+    def close_group():
+        nonlocal totals
+        group.inputs = wallet_utils.select_transaction_input(
+            available,
+            group.total,
+            max(1, max_transaction_inputs(len(group.payouts))),
+        )
+        selected_ids = {id(input) for input in group.inputs}
+        available[:] = [input for input in available if id(input) not in selected_ids]
+        totals = largest_first_totals(available)
+        groups.append(group)
+
+    for transaction in transactions:
+        amount = Decimal("{:.8f}".format(float(transaction.get("new_balance"))))
+        alone = transaction.get("alone", False)
+        if group.payouts and not alone:
+            needed = inputs_needed(group.total + amount)
+            if needed is not None and needed <= max_transaction_inputs(
+                len(group.payouts) + 1
+            ):
+                group.payouts.append((transaction, amount))
+                continue
+            close_group()
+            group = PayoutGroup()
+        elif group.payouts:
+            close_group()
+            group = PayoutGroup()
+
+        if inputs_needed(amount) is None:
+            deferred.append(transaction)
+            continue
+        # A payout that does not fit on its own is still planned, it fails
+        # with the input limit error and is split like before.
+        group.payouts.append((transaction, amount))
+        if alone:
+            close_group()
+            group = PayoutGroup()
+
+    if group.payouts:
+        close_group()
+    return groups, deferred
+
+
+def split_payout(transaction, amounts, num_inputs):
+    wallet_address = transaction.get("wallet_address")
+    transaction_type = transaction.get("type")
+    max_inputs = 255
+    num_splits = -(-num_inputs // max_inputs)  # Ceiling division
+    split_amounts = split_units(to_units(amounts), dict.fromkeys(range(num_splits), 1))
+    logging.info(
+        f"Splitting transaction for {wallet_address} into {num_splits} parts due to UTXO limit."
+    )
+    for split_amount in split_amounts.values():
+        add_transaction_to_batch(
+            wallet_address,
+            from_units(split_amount),
+            f"utxos_split_{transaction_type}",
+        )
+
+    # Remove the original transaction that exceeded the input limit
+    minerTransactionsCollection.delete_one({"id": transaction.get("id")})
+
+
+def handle_failed_payout(transaction, amounts, error, grouped=False):
+    """
+    Applies the retry policy of the error that failed a payout:
+
+    - too many inputs: the payout is split in smaller payouts,
+    - node unavailable or not enough funds: the payout is retried after a
+      backoff, as many times as needed,
+    - anything else (e.g. the node rejected it): the payout is retried after
+      a backoff, and dead-lettered after PAYOUT_MAX_ATTEMPTS such failures.
+      When the failed transaction paid several miners (grouped) the culprit
+      is unknown, so the failure is not counted and the payout is retried
+      in a transaction of its own.
+    """
+    wallet_address = transaction.get("wallet_address")
+    error_message = str(error)
+
+    if isinstance(error, TooManyInputsError):
+        split_payout(transaction, amounts, error.inputs)
+    elif isinstance(error, NodeUnavailableError):
+        logging.info(
+            f"Failed to connect with blockchain so retrying {wallet_address} later."
+        )
+        retry_payout(transaction, error_message)
+    elif isinstance(error, InsufficientFundsError):
+        logging.warning(f"Not enough funds to pay {wallet_address}, retrying later.")
+        retry_payout(transaction, error_message)
+    else:
+        logging.error(
+            f"Error during transaction processing for {wallet_address}: {error_message}"
+        )
+        if grouped:
+            retry_payout(transaction, error_message, alone=True)
+            return
+        failures = transaction.get("failures", 0) + 1
+        if failures >= config.PAYOUT_MAX_ATTEMPTS:
+            logging.error(f"Giving up on the payout of {wallet_address}.")
+            dead_letter_payout(transaction, error_message)
+        else:
+            retry_payout(transaction, error_message, failures)
+
+
+async def settle_payouts(group, transaction_hash, ledger):
+    """
+    Records the payouts of a pushed group and removes them from the queue.
+    The group is paid whatever happens here, so failures are only logged and
+    the removal is retried by the next batch.
+    """
+    for transaction, amount in group.payouts:
+        ledger.record(
+            PUSHED, transaction, "{:.8f}".format(amount), hash=transaction_hash
+        )
+    payouts = [transaction for transaction, _ in group.payouts]
+    try:
+        await asyncio.to_thread(complete_payouts, payouts)
+    except Exception as e:
+        logging.error(f"Error removing payouts paid by {transaction_hash}: {e}")
+        settled_payout_ids.update(transaction.get("id") for transaction in payouts)
+
+
+async def push_payout(semaphore, group, signed, ledger):
+    """Pushes the transaction of one payout group and records its outcome."""
+    try:
+        if isinstance(signed, Exception):
+            raise signed
+        async with semaphore:
+            transaction_hash = await push_tx(signed, wallet_utils)
+    except Exception as e:
+        logging.error(f"Caught exception: {str(e)}")
+        pool_utxos.release(group.inputs)
+        # The payouts of a failed group are grouped again once their backoff
+        # has passed.
+        for transaction, amount in group.payouts:
+            ledger.record(ERROR, transaction, "{:.8f}".format(amount), error=str(e))
+            await asyncio.to_thread(
+                handle_failed_payout,
+                transaction,
+                "{:.8f}".format(amount),
+                e,
+                len(group.payouts) > 1,
+            )
+        return False
+
+    logging.info(
+        f"transaction_hash: {transaction_hash} pays {len(group.payouts)} miners"
+    )
+    await settle_payouts(group, transaction_hash, ledger)
+    return True
+
+
 async def sign_and_push_transactions(transactions):
+    # The payout events of the batch are written with one insert_many for the
+    # attempts, before anything is pushed, and one for the outcomes.
+    ledger = PayoutLedger()
     try:
-        for transaction in transactions:
-            private_key = config.PRIVATEKEY
+        # The pool's outputs come from the UTXO cache and are split between
+        # the payout groups before anything is signed or pushed.
+        inputs = await asyncio.to_thread(pool_utxos.spendable)
+        groups, deferred = plan_payouts(transactions, inputs)
+        for group in groups:
+            pool_utxos.mark_spent(group.inputs)
+        for transaction in deferred:
             wallet_address = transaction.get("wallet_address")
-            transaction_type = transaction.get("type")
-            id = transaction.get("id")
-            # print("id", id)
-            new_balance = transaction.get("new_balance")
-            amounts = "{:.8f}".format(float(new_balance))
-
-            message = ""
-            try:
-                pushHistory.update_one(
-                    {"wallet_address": wallet_address},
-                    {
-                        "$push": {
-                            "transactions": {
-                                "id": id,
-                                "transaction_type": transaction_type,
-                                "amount": amounts,
-                                "timestamp": datetime.utcnow(),
-                            }
-                        }
-                    },
-                    upsert=True,
-                )
-                transaction_hash = await send_transaction(
-                    private_key, wallet_address, amounts, message
+            logging.warning(
+                f"Not enough spendable outputs to pay {wallet_address}, "
+                f"payout deferred for {config.PAYOUT_DEFER_DELAY} seconds."
+            )
+        await asyncio.to_thread(release_payouts, deferred, config.PAYOUT_DEFER_DELAY)
+
+        loop = asyncio.get_running_loop()
+        signed = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    signing_executor,
+                    wallet_utils.sign_payment,
+                    pool_private_key,
+                    group.inputs,
+                    group.recipients,
+                    group.amounts,
                 )
-                if transaction_hash:
-                    logging.info(f"transaction_hash: {transaction_hash}")
-                    minerTransactionsPushed.update_one(
-                        {"wallet_address": wallet_address},
-                        {
-                            "$push": {
-                                "transactions": {
-                                    "id": id,
-                                    "hash": transaction_hash,
-                                    "amount": amounts,
-                                    "timestamp": datetime.utcnow(),
-                                    "transaction_type": transaction_type,
-                                }
-                            }
-                        },
-                        upsert=True,
-                    )
-                else:
-                    logging.error(
-                        f"Transaction failed for wallet address {wallet_address}. No hash was returned."
-                    )
-                    errorTransaction.update_one(
-                        {"wallet_address": wallet_address},
-                        {
-                            "$push": {
-                                "transactions": {
-                                    "id": id,
-                                    "error": transaction_hash,
-                                    "amount": amounts,
-                                    "timestamp": datetime.utcnow(),
-                                }
-                            }
-                        },
-                        upsert=True,
-                    )
-            except Exception as e:
-                logging.error(f"Caught exception: {str(e)}")
-                error_message = str(e)
-                if "You can spend max 255 inputs" in error_message:
-                    num_inputs = int(error_message.split("not ")[-1])
-                    max_inputs = 255
-                    num_splits = -(-num_inputs // max_inputs)  # Ceiling division
-                    split_amount = float(amounts) / num_splits
-                    logging.info(
-                        f"Splitting transaction for {wallet_address} into {num_splits} parts due to UTXO limit."
-                    )
-                    for _ in range(num_splits):
-                        add_transaction_to_batch(
-                            wallet_address,
-                            split_amount,
-                            f"utxos_split_{transaction_type}",
-                        )
-
-                    # Remove the original transaction that exceeded the input limit
-                    minerTransactionsCollection.delete_one({"id": id})
-                elif "URI Too Long for url:" in error_message:
-                    split_amount = float(amounts) / 2
-                    logging.info(
-                        f"Splitting transaction for {wallet_address} into 2 parts due to URI length limit."
-                    )
-                    for _ in range(2):
-                        add_transaction_to_batch(
-                            wallet_address,
-                            split_amount,
-                            f"url_split_{transaction_type}",
-                        )
-
-                    minerTransactionsCollection.delete_one({"id": id})
-                elif "Request-URI Too Large for url:" in error_message:
-                    split_amount = float(amounts) / 2
-                    logging.info(
-                        f"Splitting transaction for {wallet_address} into 2 parts due to URI length limit."
-                    )
-                    for _ in range(2):
-                        add_transaction_to_batch(
-                            wallet_address,
-                            split_amount,
-                            f"Request-URI{transaction_type}",
-                        )
-
-                    minerTransactionsCollection.delete_one({"id": id})
-                elif (
-                    "HTTPConnectionPool" in error_message
-                    or "HTTPSConnectionPool" in error_message
-                ):
-                    logging.info(
-                        f"Failed to connect with blockchain so adding transaction for reprocessing {wallet_address} ."
-                    )
-                    add_transaction_to_batch(
-                        wallet_address, amounts, f"retry_HTTPConnectionPool"
-                    )
-                    minerTransactionsCollection.delete_one({"id": id})
-                else:
-                    logging.error(
-                        f"Error during transaction processing for {wallet_address}: {error_message}"
-                    )
-                    catchTransaction.update_one(
-                        {"wallet_address": wallet_address},
-                        {
-                            "$push": {
-                                "transactions": {
-                                    "id": id,
-                                    "error": error_message,
-                                    "amount": amounts,
-                                    "timestamp": datetime.utcnow(),
-                                }
-                            }
-                        },
-                        upsert=True,
-                    )
-                    add_transaction_to_batch(
-                        wallet_address, amounts, f"CatchError_{id}"
-                    )
-                    minerTransactionsCollection.delete_one({"id": id})
-
-        # Remove successfully processed transactions from the MongoDB collection
-        if transactions:
-            transactions_ids = [t.get("id") for t in transactions]
-            minerTransactionsCollection.delete_many({"id": {"$in": transactions_ids}})
+                for group in groups
+            ),
+            return_exceptions=True,
+        )
+
+        for group, tx in zip(groups, signed):
+            if not isinstance(tx, Exception):
+                for transaction, amount in group.payouts:
+                    ledger.record(ATTEMPT, transaction, "{:.8f}".format(amount))
+        await asyncio.to_thread(ledger.flush)
+
+        semaphore = asyncio.Semaphore(config.PAYOUT_PUSH_CONCURRENCY)
+        await asyncio.gather(
+            *(
+                push_payout(semaphore, group, tx, ledger)
+                for group, tx in zip(groups, signed)
+            )
+        )
     except Exception as e:
         logging.error(f"Error during signing and pushing transactions: {e}")
+        # Payouts already settled are gone from the queue or kept out by
+        # settled_payout_ids, so this only puts back the ones this batch did
+        # not get to.
+        release_payouts(
+            [t for t in transactions if t.get("id") not in settled_payout_ids]
+        )
+    finally:
+        try:
+            ledger.flush()
+        except Exception as e:
+            logging.error(f"Error writing the payout ledger: {e}")
+
+
+async def consolidate_dust():
+    """
+    Merges the smallest outputs of the pool wallet into a single output, so
+    that payouts keep fitting under the 255 input limit. Runs only when the
+    wallet holds more than CONSOLIDATION_MIN_INPUTS spendable outputs.
+    """
+    inputs = await asyncio.to_thread(pool_utxos.spendable)
+    if len(inputs) <= config.CONSOLIDATION_MIN_INPUTS:
+        return None
+
+    dust = sorted(inputs, key=lambda item: item.amount)[
+        : config.CONSOLIDATION_MAX_INPUTS
+    ]
+    total = sum(input.amount for input in dust)
+    pool_utxos.mark_spent(dust)
+    try:
+        loop = asyncio.get_running_loop()
+        transaction = await loop.run_in_executor(
+            signing_executor,
+            wallet_utils.sign_payment,
+            pool_private_key,
+            dust,
+            [pool_address],
+            [total],
+        )
+        transaction_hash = await push_tx(transaction, wallet_utils)
+    except Exception as e:
+        logging.error(f"Error consolidating {len(dust)} outputs: {e}")
+        pool_utxos.release(dust)
+        return None
+
+    logging.info(f"Consolidated {len(dust)} outputs in {transaction_hash}")
+    return transaction_hash
 
 
 def process_all_transactions():
     if not test_api_connection(config.API_URL):
         logging.warning("Blockchain may be down, no transactions pushed.")
         return
+    if node_breaker.is_open():
+        logging.warning("Node is failing, payouts are paused.")
+        return
     try:
-        # Fetch all transactions and sort them by timestamp
-        all_transactions = list(minerTransactionsCollection.find().sort("timestamp", 1))
-
-        # Deduplicate transactions, keeping only the latest for each wallet address
-        unique_transactions = {}
-        for transaction in all_transactions:
-            wallet_address = transaction["wallet_address"]
-            unique_transactions[wallet_address] = transaction
-
-        # Get the first 5 unique transactions based on the sorted order by timestamp
-        pending_transactions = list(unique_transactions.values())[:15]
+        complete_settled_payouts()
+        reclaim_stale_payouts()
+        pending_transactions = claim_payouts(config.PAYOUT_BATCH_SIZE)
 
         if pending_transactions:
             # Since sign_and_push_transactions is an async function,
@@ -200,6 +552,8 @@ def process_all_transactions():
 
         else:
             print("No pending transactions to process.")
+            # The payout queue is idle, use it to merge dust outputs.
+            asyncio.run(consolidate_dust())
     except Exception as e:
         print(f"Error during process_all_transactions_mongodb: {e}")
 
@@ -214,6 +568,9 @@ def add_transaction_to_batch(wallet_address, tokens_to_distribute, rewardType):
             "new_balance": float(tokens_to_distribute),
             "timestamp": datetime.utcnow(),
             "type": rewardType,
+            "status": PENDING,
+            "attempts": 0,
+            "next_attempt_at": datetime.utcnow(),
         }
 
         # Insert the document into the collection
@@ -1,19 +1,41 @@
 import redis
 import json
+import asyncio
 import datetime
 import os
 import logging
 import redis
 from database.database import r
 from mining.updateMiner import update_miner
-from core.model import load_model_from_pth, model_exe
+from core.model import (
+    verify_model_file,
+    model_exe,
+    fold_gradient,
+    get_aggregator,
+    switch_to_streaming,
+)
+from core.pool import model_pool, PoolBusyError
 from mining.activeMinig import mining_status
+from jobs.createJob import (
+    aggregation_key,
+    pending_key,
+    completed_key,
+    assignable_key,
+    leases_key,
+    lease_seconds_key,
+    weights_key,
+    FINALIZE_JOBS,
+    ensure_job_tracking,
+)
 
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
 )
 
+# Serializes folds into a job's accumulator and the final model_exe.
+job_locks = {}
+
 
 def delete_job(job_id):
     try:
@@ -24,7 +46,18 @@ def delete_job(job_id):
             logging.warning(f"Job {job_id} does not exist.")
             return False
 
-        r.delete(job_id)
+        r.delete(
+            job_id,
+            aggregation_key(job_id),
+            pending_key(job_id),
+            completed_key(job_id),
+            assignable_key(job_id),
+            leases_key(job_id),
+            lease_seconds_key(job_id),
+            weights_key(job_id),
+        )
+        r.srem(FINALIZE_JOBS, job_id)
+        job_locks.pop(job_id, None)
         logging.info(f"Job {job_id} deleted successfully.")
         return True
 
@@ -74,7 +107,48 @@ def delete_file_on_error(jobname, file_name):
         return False, f"Error deleting file: {e}"
 
 
-def update_gradient(jobname, hash_value, new_gradient, wallet_address, file_name):
+async def finalize_job(jobname):
+    """
+    Builds the combined model of a job marked in FINALIZE_JOBS and deletes
+    the job. The job stays marked when that fails, to be retried.
+    """
+    # Waits for any fold still in flight for this job.
+    async with job_locks.setdefault(jobname, asyncio.Lock()):
+        if not r.sismember(FINALIZE_JOBS, jobname):
+            return False
+        strategy = r.get(aggregation_key(jobname))
+        weights = r.hgetall(weights_key(jobname))
+        try:
+            output = await model_pool.run(
+                model_exe, "Job", jobname, strategy, weights, bounded=False
+            )
+        except Exception as e:
+            logging.error(f"Error executing the model of job {jobname}: {e}")
+            output = None
+        if not output:
+            logging.error(f"Model execution failed for job {jobname}")
+            return False
+
+    logging.info("Model execution successful")
+    result = delete_job(jobname)
+    if result:
+        print(f"Job {jobname} deleted successfully.")
+    else:
+        print(f"Failed to delete job {jobname}.")
+        r.srem(FINALIZE_JOBS, jobname)
+
+    mining_status(False)
+    return True
+
+
+async def finalize_pending_jobs():
+    for jobname in r.smembers(FINALIZE_JOBS):
+        await finalize_job(jobname)
+
+
+async def update_gradient(
+    jobname, hash_value, new_gradient, wallet_address, file_name
+):
     try:
         if not r.exists(jobname):
             return False, f"Job {jobname} not found in the database."
@@ -108,10 +182,14 @@ def update_gradient(jobname, hash_value, new_gradient, wallet_address, file_name
             model_path = f"Job/{jobname}/{file_name}"
             # print("model_path", model_path)
 
-            models = []
-            model = load_model_from_pth(model_path)
-            models.append(model)
+            if not await model_pool.run(verify_model_file, model_path):
+                logging.warning(f"Could not load a model from {model_path}")
+                delete_file_on_error(jobname, file_name)
+                return False, f"This job {hash_value} was corrupted."
 
+        except PoolBusyError as e:
+            delete_file_on_error(jobname, file_name)
+            return False, str(e)
         except FileNotFoundError:
             logging.error(f"File not found: {model_path}")
         except IOError:
@@ -125,54 +203,82 @@ def update_gradient(jobname, hash_value, new_gradient, wallet_address, file_name
             delete_file_on_error(jobname, file_name)
             return False, f"This job {hash_value} was corrupted."
 
+        # The sub-job may have changed while the model was being verified,
+        # e.g. another upload for the same hash was accepted.
+        job_data = r.hget(jobname, hash_value)
+        if not job_data:
+            delete_file_on_error(jobname, file_name)
+            return False, f"Hash {hash_value} not found in job {jobname}."
+
+        data = json.loads(job_data)
+        if data.get("gradient", 0) != 0:
+            delete_file_on_error(jobname, file_name)
+            return (
+                False,
+                f"Gradient already exists for hash {hash_value} in job {jobname}.",
+            )
+
+        previous_data = job_data
         data["gradient"] = new_gradient
         updated_data = json.dumps(data)
-        r.hset(jobname, hash_value, updated_data)
+        strategy = r.get(aggregation_key(jobname))
+        weight = get_aggregator(strategy).weight(data)
+
+        ensure_job_tracking(jobname)
+        pipe = r.pipeline()
+        pipe.hset(jobname, hash_value, updated_data)
+        pipe.srem(pending_key(jobname), hash_value)
+        pipe.zrem(assignable_key(jobname), hash_value)
+        pipe.zrem(leases_key(jobname), hash_value)
+        pipe.incr(completed_key(jobname))
+        pipe.scard(pending_key(jobname))
+        pipe.hset(weights_key(jobname), file_name, weight)
+        _, removed, _, _, completed, remaining, _ = pipe.execute()
 
         current_time = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
 
         success, message = update_miner(wallet_address, "1", current_time)
         if not success:
+            if removed:
+                # Puts the sub-job back so another upload can complete it.
+                pipe = r.pipeline()
+                pipe.hset(jobname, hash_value, previous_data)
+                pipe.sadd(pending_key(jobname), hash_value)
+                pipe.zadd(assignable_key(jobname), {hash_value: 0})
+                pipe.decr(completed_key(jobname))
+                pipe.hdel(weights_key(jobname), file_name)
+                pipe.execute()
             delete_file_on_error(jobname, file_name)
             return False, message
 
-        file_hashes = r.hgetall(jobname)
-        if not file_hashes:
-            print(f"Error: No job found with ID {jobname}.")
-            return None, None
-
-        gradient_missing = False
-
-        for key, value in file_hashes.items():
-            if isinstance(value, bytes):
-                value = value.decode("utf-8")
-
-            try:
-                data = json.loads(value)  # Load JSON data
-            except json.JSONDecodeError:
-                logging.error("Error decoding")
-                continue
-
-            if "gradient" not in data or int(data["gradient"]) == 0:
-                logging.info("Inside of Missing Gradients")
-                gradient_missing = True
-                break
-
-        if gradient_missing:
-            logging.info("Waiting for more gradients to be uploaded")
-        else:
-            output = model_exe("Job", jobname)
-            if output:
-                logging.info("Model execution successful")
-                result = delete_job(jobname)
-                if result:
-                    print(f"Job {jobname} deleted successfully.")
-                else:
-                    print(f"Failed to delete job {jobname}.")
-
-                mining_status(False)
-            else:
-                logging.error("Model execution failed")
+        try:
+            async with job_locks.setdefault(jobname, asyncio.Lock()):
+                folded = await model_pool.run(
+                    fold_gradient,
+                    "Job",
+                    jobname,
+                    model_path,
+                    strategy,
+                    weight,
+                    bounded=False,
+                )
+            if not folded:
+                raise RuntimeError("the gradient could not be folded")
+        except Exception as e:
+            # The gradient is already accepted, so model_exe will stream over
+            # all the files on disk instead of using the accumulator.
+            logging.error(f"Error aggregating {model_path}: {e}")
+            switch_to_streaming("Job", jobname)
+
+        if remaining:
+            logging.info(
+                f"Waiting for {remaining} more gradients, {completed} received"
+            )
+        elif removed:
+            # Only the upload that emptied the pending set finalizes the job.
+            # Should that fail, finalize_pending_jobs retries it.
+            r.sadd(FINALIZE_JOBS, jobname)
+            await finalize_job(jobname)
 
         return True, "Gradient updated successfully."
 
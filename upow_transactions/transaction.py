@@ -20,6 +20,22 @@ from upow_transactions.transaction_output import TransactionOutput
 print = ic
 
 
+class TooManyInputsError(Exception):
+    def __init__(self, inputs: int):
+        super().__init__(
+            f"You can spend max 255 inputs in a single transactions, not {inputs}"
+        )
+        self.inputs = inputs
+
+
+class TooManyOutputsError(Exception):
+    def __init__(self, outputs: int):
+        super().__init__(
+            f"You can have max 255 outputs in a single transactions, not {outputs}"
+        )
+        self.outputs = outputs
+
+
 class Transaction:
     def __init__(
         self,
@@ -29,13 +45,9 @@ class Transaction:
         version: int = None,
     ):
         if len(inputs) >= 256:
-            raise Exception(
-                f"You can spend max 255 inputs in a single transactions, not {len(inputs)}"
-            )
+            raise TooManyInputsError(len(inputs))
         if len(outputs) >= 256:
-            raise Exception(
-                f"You can have max 255 outputs in a single transactions, not {len(outputs)}"
-            )
+            raise TooManyOutputsError(len(outputs))
         self.inputs = inputs
         self.outputs = outputs
         self.message = message
@@ -0,0 +1,71 @@
+from bisect import bisect_left
+from utils.money import to_units
+
+
+def branch_and_bound(values, target, max_inputs, max_tries):
+    """
+    Depth-first search for a subset of values (sorted descending) summing to
+    exactly target, so the payment needs no change output. Gives up after
+    max_tries steps and returns the selected indices or None.
+    """
+    count = len(values)
+    remaining = [0] * (count + 1)
+    for i in range(count - 1, -1, -1):
+        remaining[i] = remaining[i + 1] + values[i]
+
+    selected = []
+    total = 0
+    i = 0
+    for _ in range(max_tries):
+        if total == target:
+            return selected
+        if i >= count or total + remaining[i] < target or len(selected) >= max_inputs:
+            if not selected:
+                return None
+            # Exclude the last selected value, and the values equal to it
+            # since they would lead to the same subsets.
+            last = selected.pop()
+            total -= values[last]
+            i = last + 1
+            while i < count and values[i] == values[last]:
+                i += 1
+        elif total + values[i] > target:
+            i += 1
+        else:
+            selected.append(i)
+            total += values[i]
+            i += 1
+    return None
+
+
+def select_coins(inputs, amount, max_inputs=255, max_tries=100000):
+    """
+    Selects inputs covering amount in O(n log n):
+
+    - an exact match found by branch and bound, which needs no change output,
+    - else the smallest single input covering amount,
+    - else the largest inputs until amount is covered.
+
+    Returns every input, largest first, when they cannot cover amount.
+    """
+    target = to_units(amount)
+    ordered = sorted(inputs, key=lambda item: item.amount, reverse=True)
+    values = [to_units(tx_input.amount) for tx_input in ordered]
+
+    exact = branch_and_bound(values, target, max_inputs, max_tries)
+    if exact is not None:
+        return [ordered[i] for i in exact]
+
+    ascending = values[::-1]
+    position = bisect_left(ascending, target)
+    if position < len(ascending):
+        return [ordered[len(ordered) - 1 - position]]
+
+    selected = []
+    total = 0
+    for tx_input, value in zip(ordered, values):
+        selected.append(tx_input)
+        total += value
+        if total >= target:
+            break
+    return selected
@@ -118,12 +118,54 @@ BUFFER_SIZE = 1024
 IP = "0.0.0.0"
 PORT = 5501
 CHECK_INTERVAL = 60
+PAYOUT_SIGNING_THREADS = 4
+PAYOUT_PUSH_CONCURRENCY = 4
+UTXO_CACHE_TTL = 300
+PAYOUT_BATCH_SIZE = 1000
+PAYOUT_CLAIM_TIMEOUT = 3600
+PAYOUT_RETRY_BASE_DELAY = 60
+PAYOUT_RETRY_MAX_DELAY = 3600
+PAYOUT_DEFER_DELAY = 300
+PAYOUT_MAX_ATTEMPTS = 10
+NODE_BREAKER_THRESHOLD = 5
+NODE_BREAKER_COOLDOWN = 120
+LATEST_WITHDRAWS_LIMIT = 50
+LATEST_WITHDRAWS_MAX_LIMIT = 500
+PAYOUT_ERROR_TTL = 30 * 24 * 60 * 60
+PAYOUT_MAX_RECIPIENTS = 254
+PAYOUT_MAX_TX_HEX = 64 * 1024
+COIN_SELECTION_MAX_TRIES = 100000
+CONSOLIDATION_MIN_INPUTS = 100
+CONSOLIDATION_MAX_INPUTS = 255
+BLOCK_PAGE_SIZE = 10
+CATCHUP_PAGE_SIZE = 100
+CATCHUP_CONCURRENCY = 4
+CATCHUP_MAX_BLOCKS = 2000
+RECENT_TRANSACTIONS_SIZE = 100000
+MAX_GRADIENT_SIZE = 100 * 1024 * 1024
+GRADIENT_WRITER_THREADS = 4
+GRADIENT_WRITER_QUEUE_SIZE = 64
+MODEL_POOL_SIZE = 2
+MODEL_POOL_MAX_QUEUED = 32
+SUBJOB_LEASE_SECONDS = 60
+LEASE_RENEW_INTERVAL = 15
+LEASE_SWEEP_INTERVAL = 5
+LEASE_SWEEP_BATCH = 1000
+FINALIZE_RETRY_INTERVAL = 60
+ACTIVE_MINER_WINDOW = 30 * 60
+ACTIVE_MINERS_TRIM_INTERVAL = 300
 MINERPOOL_WALLET_ADDRESS = env.MINERPOOLWALLETADDRESS
 MINERPOOL_REWARD_WALLET_ADDRESS = env.MINERPOOLREWARDWALLETADDRESS
 INODE_VALIDATOR_LIST = env.INODEVALIDATORLIST
 CORE_URL = "https://api.upow.ai"
 PRIVATEKEY = env.PRIVATEKEY
 API_URL = "https://api.upow.ai"
+HTTP_TIMEOUT = 10
+HTTP_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 0.5
+HTTP_BACKOFF_JITTER = 0.5
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_SIZE = 16
 TRACK = env.TRACKBLOCK
 FAST_API_URL = "0.0.0.0"
 FAST_API_PORT = 8003
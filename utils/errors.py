@@ -0,0 +1,14 @@
+class PayoutError(Exception):
+    """Base class of the errors that can fail a payout."""
+
+
+class InsufficientFundsError(PayoutError):
+    """The wallet has no spendable outputs covering the amount."""
+
+
+class NodeUnavailableError(PayoutError):
+    """The node could not be reached, or answered with a server error."""
+
+
+class TransactionRejectedError(PayoutError):
+    """The node received the transaction and refused it."""
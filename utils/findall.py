@@ -1,7 +1,8 @@
 from database.database import r, test_redis_connection
-import json
 import logging
 from tabulate import tabulate
+from mining.updateMiner import MINERS_INDEX, miner_key
+from utils.money import to_units, from_units
 from datetime import datetime, timedelta
 
 logging.basicConfig(
@@ -28,13 +29,17 @@ def fetch_and_process_miners():
             logging.error("Redis connection is not established.")
             return None
 
-        miners_list = r.hgetall("miners_list")
+        wallets = list(r.smembers(MINERS_INDEX))
+        pipe = r.pipeline(transaction=False)
+        for wallet in wallets:
+            pipe.hgetall(miner_key(wallet))
+        miners_list = dict(zip(wallets, pipe.execute()))
         pool_owner_details = r.hgetall("pool_owner")
     except Exception as e:
         logging.error(f"Error fetching data from Redis: {e}")
         return
 
-    total_balance = 0.0
+    total_units = 0
     active_user_count = 0
     current_time = datetime.utcnow()
     table_data = []
@@ -46,14 +51,15 @@ def fetch_and_process_miners():
                 if isinstance(wallet_address, bytes)
                 else wallet_address
             )
-            miner_details = (
-                miner_details.decode("utf-8")
-                if isinstance(miner_details, bytes)
-                else miner_details
-            )
-            details = json.loads(miner_details)
+            details = {
+                k.decode("utf-8") if isinstance(k, bytes) else k: (
+                    v.decode("utf-8") if isinstance(v, bytes) else v
+                )
+                for k, v in miner_details.items()
+            }
 
-            total_balance += details["balance"]
+            balance_units = int(details["balance_units"])
+            total_units += balance_units
             last_active_time = parse_datetime(details["last_active_time"])
             active_status = (
                 "Yes"
@@ -63,10 +69,8 @@ def fetch_and_process_miners():
             if active_status == "Yes":
                 active_user_count += 1
 
-            table_data.append([wallet_address, details["balance"], active_status])
-        except json.JSONDecodeError:
-            logging.warning(
-                f"Error decoding JSON for wallet address {wallet_address}. Skipping..."
+            table_data.append(
+                [wallet_address, from_units(balance_units), active_status]
             )
         except KeyError:
             logging.warning(
@@ -79,7 +83,7 @@ def fetch_and_process_miners():
         except Exception as e:
             logging.error(f"Unexpected error for wallet address {wallet_address}: {e}")
 
-    pool_owner_balance = 0.0
+    pool_owner_units = 0
     if pool_owner_details:
         try:
             pool_owner = {
@@ -88,12 +92,15 @@ def fetch_and_process_miners():
                 )
                 for k, v in pool_owner_details.items()
             }
-            pool_owner_balance = float(pool_owner.get("amount", 0))
-            total_balance += pool_owner_balance
+            if "amount_units" in pool_owner:
+                pool_owner_units = int(pool_owner["amount_units"])
+            else:
+                pool_owner_units = to_units(pool_owner.get("amount", 0))
+            total_units += pool_owner_units
             table_data.append(
                 [
                     "Pool Owner (" + pool_owner["wallet_address"] + ")",
-                    pool_owner_balance,
+                    from_units(pool_owner_units),
                     "N/A",
                 ]
             )
@@ -108,10 +115,10 @@ def fetch_and_process_miners():
         )
     )
     logging.info(
-        f"Total balance of all users (excluding pool owner): {total_balance - pool_owner_balance}"
+        f"Total balance of all users (excluding pool owner): {from_units(total_units - pool_owner_units)}"
     )
-    logging.info(f"Pool owner balance: {pool_owner_balance}")
-    logging.info(f"Combined total balance: {total_balance}")
+    logging.info(f"Pool owner balance: {from_units(pool_owner_units)}")
+    logging.info(f"Combined total balance: {from_units(total_units)}")
     logging.info(f"Total active users in the last 30 minutes: {active_user_count}")
 
 
@@ -0,0 +1,58 @@
+from decimal import Decimal, ROUND_HALF_EVEN
+from upow_transactions.constants import SMALLEST
+
+# Balances are kept as integer smallest units (1 coin = SMALLEST units), the
+# same fixed-point representation the chain uses for transaction amounts.
+UNIT = Decimal(1) / SMALLEST
+
+
+def to_units(amount, exact=False):
+    """
+    Converts a coin amount (str, int, float or Decimal) to integer smallest
+    units. Amounts with more than 8 decimal places are rounded, or rejected
+    with ValueError when exact is set.
+    """
+    value = Decimal(str(amount))
+    if not value.is_finite():
+        raise ValueError(f"Invalid amount: {amount}")
+    quantized = value.quantize(UNIT, rounding=ROUND_HALF_EVEN)
+    if exact and quantized != value:
+        raise ValueError(f"Amount {amount} has more than 8 decimal places")
+    return int(quantized * SMALLEST)
+
+
+def from_units(units):
+    return (Decimal(int(units)) / SMALLEST).quantize(UNIT)
+
+
+def format_units(units):
+    return f"{from_units(units):.8f}"
+
+
+def percent_of(units, percent):
+    """Returns percent% of units, rounded down to a whole unit."""
+    return int(units) * percent // 100
+
+
+def split_units(units, weights):
+    """
+    Splits units between the keys of weights proportionally to their weight.
+    Shares are rounded down and the units left over are handed out one by one
+    by largest remainder, so the shares always sum exactly to units.
+    """
+    total_weight = sum(weights.values())
+    if total_weight <= 0:
+        raise ValueError("Weights must sum to a positive value")
+
+    shares = {}
+    remainders = []
+    for key, weight in weights.items():
+        share, remainder = divmod(units * weight, total_weight)
+        shares[key] = share
+        remainders.append((remainder, key))
+
+    leftover = units - sum(shares.values())
+    remainders.sort(key=lambda item: item[0], reverse=True)
+    for _, key in remainders[:leftover]:
+        shares[key] += 1
+    return shares
@@ -1,8 +1,10 @@
 import redis
-import json
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 
 from database.database import r
+import utils.config as config
+from mining.updateMiner import ACTIVE_MINERS, miner_key
 
 
 def parse_datetime(time_str_or_int):
@@ -18,28 +20,22 @@ def parse_datetime(time_str_or_int):
 
 
 def check_active_users():
-    current_time = datetime.utcnow()
-    active_user_count = 0
     try:
-        miners_list = r.hgetall("miners_list")
-        for _, miner_details in miners_list.items():
-            details = json.loads(miner_details)
-            last_active_time = parse_datetime(details["last_active_time"])
-            if (current_time - last_active_time) < timedelta(minutes=30):
-                active_user_count += 1
-        return active_user_count
+        cutoff = time.time() - config.ACTIVE_MINER_WINDOW
+        return r.zcount(ACTIVE_MINERS, f"({cutoff}", "+inf")
     except Exception as e:
         raise e
 
 
 def check_wallet_active(wallet_address: str):
     try:
-        miner_details = r.hget("miners_list", wallet_address)
-        if not miner_details:
-            return {"active": False, "message": "Wallet address not found"}
-        details = json.loads(miner_details)
-        last_active_time = parse_datetime(details["last_active_time"])
-        active_status = (datetime.utcnow() - last_active_time) < timedelta(minutes=30)
+        last_active = r.zscore(ACTIVE_MINERS, wallet_address)
+        if last_active is None:
+            # Trimmed from the activity index, or never seen at all.
+            if not r.exists(miner_key(wallet_address)):
+                return {"active": False, "message": "Wallet address not found"}
+            return {"active": False}
+        active_status = time.time() - last_active < config.ACTIVE_MINER_WINDOW
         return {"active": active_status}
     except Exception as e:
         raise e
@@ -1,8 +1,11 @@
+import asyncio
 from decimal import Decimal, ROUND_DOWN
 import utils.config as config
 from fastecdsa import curve, keys
 
 from repository import WalletRepository
+from utils.coinselect import select_coins
+from utils.errors import InsufficientFundsError
 from upow_transactions.constants import CURVE, MAX_INODES
 from upow_transactions.helpers import (
     string_to_point,
@@ -27,6 +30,50 @@ class Utils:
         result = self.repo.get_balance_info(address)
         return result
 
+    def get_spendable_inputs(self, address: str):
+        r_json = self.repo.get_address_info(address)
+        return self.repo.get_address_input_from_json(r_json, address=address)
+
+    def sign_payment(
+        self,
+        private_key,
+        transaction_inputs,
+        receiving_addresses,
+        amounts,
+        message: bytes = None,
+        send_back_address=None,
+    ):
+        """
+        Builds and signs a payment to one or more receiving addresses that
+        spends exactly transaction_inputs.
+        """
+        if len(receiving_addresses) != len(amounts):
+            raise Exception(
+                "Receiving addresses length is different from amounts length"
+            )
+        amounts = [Decimal(amount) for amount in amounts]
+        total_amount = sum(amounts)
+        if send_back_address is None:
+            send_back_address = point_to_string(keys.get_public_key(private_key, CURVE))
+
+        transaction_amount = sum(input.amount for input in transaction_inputs)
+        if transaction_amount < total_amount:
+            raise InsufficientFundsError("Error: You don't have enough funds")
+
+        transaction_outputs = [
+            TransactionOutput(receiving_address, amount=amount)
+            for receiving_address, amount in zip(receiving_addresses, amounts)
+        ]
+        if transaction_amount > total_amount:
+            transaction_outputs.append(
+                TransactionOutput(send_back_address, transaction_amount - total_amount)
+            )
+
+        transaction = Transaction(transaction_inputs, transaction_outputs, message)
+
+        transaction.sign([private_key])
+        return transaction
+
     async def create_transaction(
         self,
         private_key,
@@ -41,16 +88,16 @@ class Utils:
         if send_back_address is None:
             send_back_address = sender_address
 
-        r_json = self.repo.get_address_info(sender_address)
+        r_json = await asyncio.to_thread(self.repo.get_address_info, sender_address)
         address_inputs = self.repo.get_address_input_from_json(
             r_json, address=sender_address
         )
         inputs.extend(address_inputs)
         if not inputs:
-            raise Exception("No spendable outputs")
+            raise InsufficientFundsError("No spendable outputs")
 
         if sum(input.amount for input in inputs) < amount:
-            raise Exception(f"Error: You don't have enough funds")
+            raise InsufficientFundsError("Error: You don't have enough funds")
 
         transaction_inputs = self.select_transaction_input(inputs, amount)
 
@@ -92,19 +139,19 @@ class Utils:
         if send_back_address is None:
             send_back_address = sender_address
 
-        r_json = self.repo.get_address_info(sender_address)
+        r_json = await asyncio.to_thread(self.repo.get_address_info, sender_address)
         address_inputs = self.repo.get_address_input_from_json(
             r_json, address=sender_address
         )
         inputs.extend(address_inputs)
 
         if not inputs:
-            raise Exception("No spendable outputs")
+            raise InsufficientFundsError("No spendable outputs")
 
         total_input_amount = sum(input.amount for input in inputs)
 
         if total_input_amount < total_amount:
-            raise Exception(f"Error: You don't have enough funds")
+            raise InsufficientFundsError("Error: You don't have enough funds")
 
         transaction_inputs = []
         transaction_outputs = []
@@ -145,7 +192,8 @@ class Utils:
         if send_back_address is None:
             send_back_address = sender_address
 
-        result_json = self.repo.get_address_info(
+        result_json = await asyncio.to_thread(
+            self.repo.get_address_info,
             sender_address,
             stake_outputs=True,
             delegate_unspent_votes=True,
@@ -156,10 +204,10 @@ class Utils:
         )
 
         if not inputs:
-            raise Exception("No spendable outputs")
+            raise InsufficientFundsError("No spendable outputs")
 
         if sum(input.amount for input in inputs) < amount:
-            raise Exception(f"Error: You don't have enough funds")
+            raise InsufficientFundsError("Error: You don't have enough funds")
 
         stake_inputs = self.repo.get_stake_input_from_json(
             result_json, address=sender_address
@@ -210,7 +258,9 @@ class Utils:
 
     async def create_unstake_transaction(self, private_key):
         sender_address = point_to_string(keys.get_public_key(private_key, CURVE))
-        result_json = self.repo.get_address_info(sender_address, stake_outputs=True)
+        result_json = await asyncio.to_thread(
+            self.repo.get_address_info, sender_address, stake_outputs=True
+        )
         stake_inputs = self.repo.get_stake_input_from_json(
             result_json, address=sender_address
         )
@@ -239,18 +289,18 @@ class Utils:
         inputs = []
         address = point_to_string(keys.get_public_key(private_key, CURVE))
 
-        result_json = self.repo.get_address_info(
-            address, stake_outputs=True, address_state=True
+        result_json = await asyncio.to_thread(
+            self.repo.get_address_info, address, stake_outputs=True, address_state=True
         )
         inputs.extend(
             self.repo.get_address_input_from_json(result_json, address=address)
         )
 
         if not inputs:
-            raise Exception("No spendable outputs")
+            raise InsufficientFundsError("No spendable outputs")
 
         if sum(input.amount for input in inputs) < amount:
-            raise Exception(f"Error: You don't have enough funds")
+            raise InsufficientFundsError("Error: You don't have enough funds")
 
         stake_inputs = self.repo.get_stake_input_from_json(result_json, address=address)
         if not stake_inputs:
@@ -266,7 +316,7 @@ class Utils:
                 f"This address is registered as validator and a validator cannot be an inode."
             )
 
-        inode_addresses = self.repo.get_dobby_info()
+        inode_addresses = await asyncio.to_thread(self.repo.get_dobby_info)
         if len(inode_addresses) >= MAX_INODES:
             raise Exception(f"{MAX_INODES} inodes are already registered.")
 
@@ -305,8 +355,8 @@ class Utils:
         inputs = []
         address = point_to_string(keys.get_public_key(private_key, CURVE))
 
-        result_json = self.repo.get_address_info(
-            address, inode_registration_outputs=True
+        result_json = await asyncio.to_thread(
+            self.repo.get_address_info, address, inode_registration_outputs=True
         )
         inputs.extend(
             self.repo.get_inode_registration_input_from_json(
@@ -317,7 +367,7 @@ class Utils:
         if not inputs:
             raise Exception("This address is not registered as an inode.")
 
-        active_inode_addresses = self.repo.get_dobby_info()
+        active_inode_addresses = await asyncio.to_thread(self.repo.get_dobby_info)
         is_inode_active = any(
             entry.get("wallet") == address for entry in active_inode_addresses
         )
@@ -336,18 +386,18 @@ class Utils:
         amount = Decimal(1)
         inputs = []
         address = point_to_string(keys.get_public_key(private_key, CURVE))
-        result_json = self.repo.get_address_info(
-            address, stake_outputs=True, address_state=True
+        result_json = await asyncio.to_thread(
+            self.repo.get_address_info, address, stake_outputs=True, address_state=True
         )
         inputs.extend(
             self.repo.get_address_input_from_json(result_json, address=address)
         )
 
         if not inputs:
-            raise Exception("No spendable outputs")
+            raise InsufficientFundsError("No spendable outputs")
 
         if sum(input.amount for input in inputs) < amount:
-            raise Exception(f"Error: You don't have enough funds")
+            raise InsufficientFundsError("Error: You don't have enough funds")
 
         stake_inputs = self.repo.get_stake_input_from_json(result_json, address=address)
         if not stake_inputs:
@@ -412,7 +462,8 @@ class Utils:
             raise Exception("Invalid voting range")
 
         address = point_to_string(keys.get_public_key(private_key, CURVE))
-        result_json = self.repo.get_address_info(
+        result_json = await asyncio.to_thread(
+            self.repo.get_address_info,
             address,
             stake_outputs=True,
             address_state=True,
@@ -528,17 +579,13 @@ class Utils:
         transaction.sign([private_key])
         return transaction
 
-    def select_transaction_input(self, inputs, amount):
-        transaction_inputs = []
-        for tx_input in sorted(inputs, key=lambda item: item.amount):
-            if tx_input.amount >= amount:
-                transaction_inputs.append(tx_input)
-                break
-        for tx_input in sorted(inputs, key=lambda item: item.amount, reverse=True):
-            if sum(input.amount for input in transaction_inputs) >= amount:
-                break
-            transaction_inputs.append(tx_input)
-        return transaction_inputs
+    def select_transaction_input(self, inputs, amount, max_inputs=255):
+        return select_coins(
+            inputs,
+            amount,
+            max_inputs=max_inputs,
+            max_tries=config.COIN_SELECTION_MAX_TRIES,
+        )
 
     def string_to_bytes(self, string: str) -> bytes:
         if string is None:
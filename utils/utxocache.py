@@ -0,0 +1,73 @@
+import threading
+import time
+import logging
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+
+def output_key(tx_input):
+    return tx_input.tx_hash, tx_input.index
+
+
+class UtxoCache:
+    """
+    Spendable outputs of one address (the pool wallet), so that payouts do
+    not fetch the whole address info from the node every time.
+
+    Spent outputs are dropped as soon as they are handed to a payout and kept
+    in a spent set until the node stops reporting them. Change of pushed
+    payouts is not spendable until the node reports it after confirmation.
+    The cache is reconciled with the node every ttl seconds, and invalidated
+    whenever a push fails.
+    """
+
+    def __init__(self, address, ttl, fetch):
+        self.address = address
+        self.ttl = ttl
+        self.fetch = fetch
+        self.lock = threading.Lock()
+        self.inputs = {}
+        self.spent = {}
+        self.fetched_at = None
+
+    def _reconcile(self):
+        reported = {
+            output_key(tx_input): tx_input for tx_input in self.fetch(self.address)
+        }
+        now = time.monotonic()
+        # An output the node still reports long after it was spent belongs to
+        # a payout that never made it into a block, so it is spendable again.
+        self.spent = {
+            key: spent_at
+            for key, spent_at in self.spent.items()
+            if key in reported and now - spent_at < self.ttl
+        }
+        self.inputs = {
+            key: tx_input for key, tx_input in reported.items() if key not in self.spent
+        }
+        self.fetched_at = now
+
+    def spendable(self):
+        """Returns the spendable outputs, reconciling them first when stale."""
+        with self.lock:
+            now = time.monotonic()
+            if self.fetched_at is None or now - self.fetched_at > self.ttl:
+                self._reconcile()
+            return list(self.inputs.values())
+
+    def mark_spent(self, tx_inputs):
+        with self.lock:
+            now = time.monotonic()
+            for tx_input in tx_inputs:
+                key = output_key(tx_input)
+                self.inputs.pop(key, None)
+                self.spent[key] = now
+
+    def release(self, tx_inputs):
+        """Returns the outputs of a payout that failed and reconciles."""
+        with self.lock:
+            for tx_input in tx_inputs:
+                self.spent.pop(output_key(tx_input), None)
+            self.fetched_at = None